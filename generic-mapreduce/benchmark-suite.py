@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Benchmark Suite for the Generic Map-Reduce Framework
+Generates synthetic repositories and reports per-stage time and memory using the mock engine
+"""
+
+import argparse
+import gc
+import importlib.util
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+FRAMEWORK_PATH = Path(__file__).resolve().parent / "generic-mapreduce.py"
+DEFAULT_CONFIG = Path(__file__).resolve().parent / "configurations" / "vibe-check-config-example.json"
+
+
+def load_framework():
+    """Import generic-mapreduce.py as a module"""
+    spec = importlib.util.spec_from_file_location("generic_mapreduce", FRAMEWORK_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class SyntheticRepo:
+    """Writes a deterministic tree of source-like files"""
+
+    EXTENSIONS = ['.py', '.js', '.ts', '.go', '.java', '.md', '.json', '.min.js']
+    FILES_PER_DIR = 100
+
+    def __init__(self, root: Path, files: int, avg_bytes: int, seed: int):
+        self.root = root
+        self.files = files
+        self.avg_bytes = avg_bytes
+        self.seed = seed
+
+    def generate(self):
+        """Create the files; about 5% land in node_modules to exercise directory exclusion"""
+        rng = random.Random(self.seed)
+        directory = None
+        for i in range(self.files):
+            if i % self.FILES_PER_DIR == 0:
+                top = "node_modules" if rng.random() < 0.05 else f"pkg{i // 10000:03d}"
+                directory = self.root / top / f"mod{i // self.FILES_PER_DIR:05d}"
+                directory.mkdir(parents=True, exist_ok=True)
+
+            ext = rng.choice(self.EXTENSIONS)
+            lines = max(1, int(rng.expovariate(1 / self.avg_bytes)) // 32)
+            body = "".join(f"def handler_{i}_{n}(value):\n    return value + {n}\n" for n in range(0, lines, 2))
+            (directory / f"file{i:07d}{ext}").write_text(body)
+
+
+class StageTimer:
+    """Runs stages and records wall time, traced peak memory and process max RSS"""
+
+    def __init__(self, trace_memory: bool = True):
+        self.trace_memory = trace_memory
+        self.results: List[Dict[str, Any]] = []
+
+    def measure(self, stage: str, files: int, items: int, fn: Callable[[], Any]):
+        """Run one stage with framework output silenced"""
+        gc.collect()
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            fn()
+        elapsed = time.perf_counter() - start
+        peak = 0
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        record = {
+            'stage': stage,
+            'files': files,
+            'items': items,
+            'seconds': elapsed,
+            'us_per_item': elapsed / items * 1e6 if items else 0.0,
+            'peak_mb': peak / 1e6,
+            'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3 if resource else 0.0
+        }
+        self.results.append(record)
+        print(f"  {stage:<16} {elapsed:>9.3f}s {record['us_per_item']:>11.1f}us/item "
+              f"{record['peak_mb']:>9.1f}MB peak {record['max_rss_mb']:>9.1f}MB rss")
+
+
+def bench_config(base_config: Dict[str, Any], seed: int) -> Dict[str, Any]:
+    """Base config switched to filesystem collection, inline results and the mock engine"""
+    config = json.loads(json.dumps(base_config))
+    config['project']['name'] = "bench"
+    config['populate']['collection_strategy'] = "filesystem"
+    config['populate']['item_filters'].setdefault('exclude_directories', []).append("bench-framework")
+    config['map']['output_mode'] = "inline"
+    config.setdefault('execution', {}).update({'engine': "mock", 'mock': {'seed': seed}})
+    return config
+
+
+def check_journal(framework, mapreduce, expected: Dict[str, Any]) -> List[str]:
+    """Replay the journal against the in-memory data, then crash-recover from a torn final line"""
+    def dump(data):
+        return json.dumps(data, sort_keys=True, default=framework.Item.to_dict)
+
+    store = mapreduce.master_store
+    failures = []
+    if dump(store.load()) != dump(expected):
+        failures.append("replayed journal does not match the saved data")
+
+    # A crash mid-append leaves half a line; loading ignores it and the next save cuts it off
+    with open(store.journal_path, 'a') as f:
+        f.write('{"items": {"torn')
+    data = store.load()
+    if dump(data) != dump(expected):
+        failures.append("a torn final journal line changed the replayed data")
+    key = next(iter(data['items']))
+    data['items'][key]['loc'] = -1
+    mapreduce._save_master_data(data)
+    reloaded = store.load()
+    if reloaded['items'][key].get('loc') != -1 or store._journal_torn_at is not None:
+        failures.append("the save after a torn journal line was not replayed cleanly")
+    return failures
+
+
+def run_size(framework, base_config: Dict[str, Any], files: int, args, timer: StageTimer) -> List[str]:
+    """Benchmark every stage against one synthetic repository; returns journal check failures"""
+    workdir = Path(tempfile.mkdtemp(prefix=f"bench-{files}-", dir=args.workdir))
+    cwd = os.getcwd()
+    print(f"=== {files:,} files ({workdir}) ===")
+    try:
+        repo = SyntheticRepo(workdir, files, args.avg_bytes, args.seed)
+        timer.measure("generate", files, files, repo.generate)
+
+        config_path = workdir / "config.json"
+        with open(config_path, 'w') as f:
+            json.dump(bench_config(base_config, args.seed), f)
+
+        os.chdir(workdir)
+        mapreduce = framework.GenericMapReduce(config_path)
+        timer.measure("populate", files, files, mapreduce.populate)
+
+        items = len(mapreduce._load_master_data().get('items', {}))
+        timer.measure("load_master", files, items, mapreduce._load_master_data)
+        master_data = mapreduce._load_master_data()
+        timer.measure("save_master", files, items, lambda data=master_data: mapreduce._save_master_data(data))
+        del master_data
+
+        # Journaled saves append one line per save; load replays them on top of master.json
+        store = mapreduce.master_store
+        store.journal, store.compact_every = True, args.journal_saves + 2
+        master_data = mapreduce._load_master_data()
+        keys = list(master_data['items'])[:args.journal_saves]
+
+        def journal_saves(data=master_data):
+            for n, key in enumerate(keys):
+                data['items'][key]['loc'] = n
+                mapreduce._save_master_data(data)
+
+        timer.measure("journal_append", files, len(keys), journal_saves)
+        timer.measure("journal_replay", files, items, mapreduce._load_master_data)
+        failures = check_journal(framework, mapreduce, master_data) if keys else []
+        store.rewrite(mapreduce._load_master_data())
+        store.journal = False
+        del master_data
+        timer.measure("status", files, items, mapreduce.status)
+
+        map_items = min(args.map_items, items)
+        timer.measure("map", files, map_items, lambda: [mapreduce.map_process() for _ in range(map_items)])
+        timer.measure("collect_results", files, map_items, mapreduce._collect_results)
+        timer.measure("reduce", files, map_items, lambda: mapreduce.reduce_synthesize("low", "all"))
+        return failures
+    finally:
+        os.chdir(cwd)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: Path, threshold: float) -> int:
+    """Report stages slower than the baseline by more than the threshold"""
+    with open(baseline_path, 'r') as f:
+        baseline = {(r['stage'], r['files']): r for r in json.load(f)['results']}
+
+    regressions = 0
+    for record in results:
+        previous = baseline.get((record['stage'], record['files']))
+        if record['stage'] == "generate" or not previous or not previous['seconds']:
+            continue
+        change = record['seconds'] / previous['seconds'] - 1
+        if change > threshold:
+            regressions += 1
+            print(f"REGRESSION {record['stage']} @ {record['files']:,} files: "
+                  f"{previous['seconds']:.3f}s -> {record['seconds']:.3f}s (+{change:.0%})")
+
+    if not regressions:
+        print(f"No regressions beyond {threshold:.0%} against {baseline_path}")
+    return 1 if regressions else 0
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description="Benchmark the map-reduce framework against synthetic repositories"
+    )
+    parser.add_argument("--files", default="1000,10000",
+                        help="Comma-separated repository sizes to generate (e.g. 1000,100000,1000000)")
+    parser.add_argument("--config", type=Path, default=DEFAULT_CONFIG, help="Base configuration file")
+    parser.add_argument("--avg-bytes", type=int, default=800, help="Mean synthetic file size")
+    parser.add_argument("--map-items", type=int, default=50, help="Items to run through the mock map stage")
+    parser.add_argument("--journal-saves", type=int, default=50,
+                        help="Single-item saves appended to the master journal before it is replayed and checked")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for repository generation and the mock engine")
+    parser.add_argument("--workdir", type=Path, help="Directory for synthetic repositories (default: system temp)")
+    parser.add_argument("--keep", action="store_true", help="Keep generated repositories")
+    parser.add_argument("--no-trace-memory", action="store_true",
+                        help="Skip tracemalloc, which slows Python-heavy stages")
+    parser.add_argument("--json", type=Path, help="Write results to this file")
+    parser.add_argument("--baseline", type=Path, help="Earlier --json output to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown before flagging a regression")
+
+    args = parser.parse_args()
+
+    framework = load_framework()
+    with open(args.config, 'r') as f:
+        base_config = json.load(f)
+
+    timer = StageTimer(trace_memory=not args.no_trace_memory)
+    failures = []
+    for files in (int(size) for size in args.files.split(',')):
+        failures.extend(f"JOURNAL {files:,} files: {failure}"
+                        for failure in run_size(framework, base_config, files, args, timer))
+    for failure in failures:
+        print(failure)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'seed': args.seed, 'avg_bytes': args.avg_bytes, 'results': timer.results}, f, indent=2)
+        print(f"Results written to {args.json}")
+
+    if args.baseline:
+        return compare(timer.results, args.baseline, args.threshold) or (1 if failures else 0)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
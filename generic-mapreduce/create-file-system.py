@@ -318,13 +318,8 @@ Only add patterns that would genuinely help future reviews. Skip obvious languag
         with open(config_path, 'r') as f:
             self.config = json.load(f)
 
-        self.data_dir = self.framework_dir / "data"
-        self.results_dir = self.framework_dir / "results"
-        self.synthesis_dir = self.framework_dir / "synthesis"
-        self.logs_dir = self.framework_dir / "logs"
-
-        # Initialize processing engine
-        self.processing_engine = ClaudeProcessingEngine()
+        self._metrics_textfile = None
+        self._init_runtime()
 
     '''
 
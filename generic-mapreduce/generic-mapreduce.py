@@ -5,16 +5,27 @@ Configurable system for populate -> map -> reduce workflows
 """
 
 import argparse
+import http.client
 import json
+import math
+import os
+import queue
 import re
 import subprocess
 import sys
+import threading
 import time
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
-from datetime import datetime
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
 
 # ANSI colors for output
 R, G, Y, B, N = "\033[0;31m", "\033[0;32m", "\033[1;33m", "\033[0;34m", "\033[0m"
@@ -25,6 +36,286 @@ def status(color, msg):
     print(f"{color}{msg}{N}")
 
 
+# Captured at import so the startup span covers interpreter and config loading
+PROCESS_START_NS = time.time_ns()
+
+
+class Span:
+    """One timed operation; attributes can be added while it is open"""
+
+    def __init__(self, name: str, span_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+
+    def set(self, **attributes):
+        """Attach attributes to the span"""
+        self.attributes.update(attributes)
+
+
+class _NullSpan:
+    """Stand-in yielded while tracing is disabled"""
+
+    span_id = None
+
+    def set(self, **attributes):
+        pass
+
+
+class Tracer:
+    """Nested timing spans appended to a JSONL file using OTLP span field names"""
+
+    def __init__(self):
+        self.path: Optional[Path] = None
+        self.trace_id = os.urandom(16).hex()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def configure(self, path: Path):
+        """Start exporting spans to path; the directory is created on first export"""
+        self.path = path
+
+    def _stack(self) -> List[str]:
+        """Open span ids on this thread"""
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def current(self) -> Optional[str]:
+        """Id of the innermost open span on this thread"""
+        stack = self._stack() if self.enabled else None
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def attach(self, parent_id: Optional[str]):
+        """Parent spans opened in a worker thread under a span from another thread"""
+        if not self.enabled or parent_id is None:
+            yield
+            return
+        stack = self._stack()
+        stack.append(parent_id)
+        try:
+            yield
+        finally:
+            stack.pop()
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Time the enclosed block as a child of the current span"""
+        if not self.enabled:
+            yield _NullSpan()
+            return
+
+        stack = self._stack()
+        span = Span(name, os.urandom(8).hex(), stack[-1] if stack else None, attributes)
+        stack.append(span.span_id)
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            stack.pop()
+            self._export(span, time.time_ns(), error)
+
+    def record(self, name: str, start_ns: int, end_ns: int, **attributes):
+        """Export an already-timed span under the current span"""
+        if not self.enabled:
+            return
+        span = Span(name, os.urandom(8).hex(), self.current(), attributes)
+        span.start_ns = start_ns
+        self._export(span, end_ns, None)
+
+    def timed_iter(self, name: str, iterable: Iterable) -> Iterator:
+        """Pass items through, exporting one span with the time spent producing them
+
+        Time spent in nested timed iterators is excluded, so chained pipeline stages each
+        report their own cost.
+        """
+        if not self.enabled:
+            yield from iterable
+            return
+
+        iterator = iter(iterable)
+        start_ns = time.time_ns()
+        own_ns = 0
+        count = 0
+        while True:
+            outer_nested = getattr(self._local, 'nested_ns', 0)
+            self._local.nested_ns = 0
+            began = time.perf_counter_ns()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                elapsed = time.perf_counter_ns() - began
+                own_ns += elapsed - self._local.nested_ns
+                self._local.nested_ns = outer_nested + elapsed
+            count += 1
+            yield item
+        self.record(name, start_ns, start_ns + own_ns, items=count, exclusive=True)
+
+    def traced(self, name: str):
+        """Decorator wrapping every call of a function in a span"""
+        def decorator(fn):
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            wrapper.__name__ = fn.__name__
+            wrapper.__doc__ = fn.__doc__
+            return wrapper
+        return decorator
+
+    def _export(self, span: Span, end_ns: int, error: Optional[str]):
+        """Append one finished span"""
+        record = {
+            'traceId': self.trace_id,
+            'spanId': span.span_id,
+            'parentSpanId': span.parent_id,
+            'name': span.name,
+            'startTimeUnixNano': span.start_ns,
+            'endTimeUnixNano': end_ns,
+            'durationMs': (end_ns - span.start_ns) / 1e6,
+            'status': {'code': 'ERROR', 'message': error} if error else {'code': 'OK'},
+            'attributes': span.attributes,
+            'thread': threading.current_thread().name
+        }
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a') as f:
+                f.write(line)
+
+
+TRACER = Tracer()
+
+
+class MetricsRegistry:
+    """Process-wide counters, gauges and histograms in the Prometheus text exposition format"""
+
+    LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600)
+
+    # name -> (type, help, histogram buckets)
+    DEFINITIONS = {
+        'mapreduce_items_completed_total': ('counter', "Items marked completed", None),
+        'mapreduce_map_failures_total': ('counter', "Map steps that failed during map-all", None),
+        'mapreduce_engine_calls_total': ('counter', "Processing engine calls by kind and outcome", None),
+        'mapreduce_tokens_total': ('counter', "Tokens by type; input includes cache reads", None),
+        'mapreduce_cost_usd_total': ('counter', "Reported or estimated cost in USD", None),
+        'mapreduce_engine_call_seconds': ('histogram', "Processing engine call latency", LATENCY_BUCKETS),
+        'mapreduce_time_to_first_token_seconds': ('histogram', "Time to the first model output", LATENCY_BUCKETS),
+        'mapreduce_map_item_seconds': ('histogram', "Wall time of one map step in map-all", LATENCY_BUCKETS),
+        'mapreduce_items_remaining': ('gauge', "Items not yet completed (queue depth)", None),
+        'mapreduce_active_engine_calls': ('gauge', "Engine calls in flight (active workers)", None),
+        'mapreduce_last_completion_timestamp_seconds': ('gauge', "Unix time an item last completed", None),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[str, Dict[Tuple[Tuple[str, str], ...], Any]] = {name: {} for name in self.DEFINITIONS}
+
+    def inc(self, name: str, amount: float = 1.0, **labels):
+        """Add to a counter or gauge"""
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            self._values[name][key] = self._values[name].get(key, 0.0) + amount
+
+    def set(self, name: str, value: float, **labels):
+        """Set a gauge"""
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            self._values[name][key] = value
+
+    def observe(self, name: str, value: float, **labels):
+        """Record one histogram observation"""
+        buckets = self.DEFINITIONS[name][2]
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            counts = self._values[name].setdefault(key, [0] * (len(buckets) + 1) + [0.0])
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    @staticmethod
+    def _labels(key: Tuple[Tuple[str, str], ...], le: Optional[str] = None) -> str:
+        """Render a label set"""
+        parts = [f'{k}="{v}"' for k, v in key] + ([f'le="{le}"'] if le else [])
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    @staticmethod
+    def _number(value: float) -> str:
+        """Sample value without exponent rounding"""
+        return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+    def render(self) -> str:
+        """Exposition text for every metric that has a sample"""
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, buckets) in self.DEFINITIONS.items():
+                samples = self._values[name]
+                if not samples:
+                    continue
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in sorted(samples.items()):
+                    if kind != 'histogram':
+                        lines.append(f"{name}{self._labels(key)} {self._number(value)}")
+                        continue
+                    for bound, count in zip([f"{b:g}" for b in buckets] + ["+Inf"], value):
+                        lines.append(f"{name}_bucket{self._labels(key, bound)} {count}")
+                    lines.append(f"{name}_count{self._labels(key)} {value[-2]}")
+                    lines.append(f"{name}_sum{self._labels(key)} {self._number(value[-1])}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: Path):
+        """Atomically replace a node_exporter textfile-collector file"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(path.name + f".{os.getpid()}.tmp")
+        with open(temp_path, 'w') as f:
+            f.write(self.render())
+        os.replace(temp_path, path)
+
+    def serve(self, host: str, port: int):
+        """Serve /metrics from a daemon thread"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        return server
+
+
+METRICS = MetricsRegistry()
+
+
 @dataclass
 class ProcessingResult:
     """Standardized result from any processing engine"""
@@ -34,8 +325,11 @@ class ProcessingResult:
     input_tokens: int = 0
     output_tokens: int = 0
     total_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_creation_tokens: int = 0
     cost_usd: float = 0.0
     duration: float = 0.0
+    time_to_first_token: Optional[float] = None
     error_message: Optional[str] = None
     raw_data: Optional[Dict[str, Any]] = None
 
@@ -58,18 +352,130 @@ class ProcessingEngine(ABC):
         """Synthesize multiple results"""
         pass
 
+    def fingerprint(self) -> str:
+        """Identifies this engine setup; a cached availability probe only applies to the same fingerprint"""
+        return type(self).__name__
+
+    def describe(self) -> Dict[str, Any]:
+        """Pre-flight details: availability, version, authentication and required capabilities"""
+        return {'engine': type(self).__name__, 'available': self.check_availability(),
+                'version': None, 'auth': None, 'capabilities': {}}
+
+    def warm_up(self, connections: int = 1):
+        """Prepare for the first real call; engines without start-up cost do nothing"""
+        pass
+
+    def set_cache_prefixes(self, prefixes: Iterable[str]):
+        """Prompt prefixes shared by many calls, which engines with explicit prompt caching can mark"""
+        pass
+
+
+class StreamEventParser:
+    """Decodes stream-json lines, skipping events nobody listens to before fully decoding them"""
+
+    # The CLI writes "type" as the first key, so it can be read without parsing the whole line
+    TYPE_PREFIX = re.compile(r'\s*\{\s*"type"\s*:\s*"([^"]*)"')
+
+    def __init__(self):
+        self.handlers: Dict[str, List[Tuple[Optional[str], Callable[[Dict[str, Any]], None]]]] = {}
+        self.skipped = 0
+        self.malformed = 0
+        self.first_seen: Dict[str, float] = {}
+
+    def on(self, event_type: str, callback: Callable[[Dict[str, Any]], None], contains: Optional[str] = None):
+        """Register a callback for an event type, optionally only for lines containing a substring"""
+        self.handlers.setdefault(event_type, []).append((contains, callback))
+        return self
+
+    def _callbacks(self, event_type: Optional[str], line: str) -> List[Callable[[Dict[str, Any]], None]]:
+        """Callbacks interested in this line"""
+        return [callback for contains, callback in self.handlers.get(event_type, [])
+                if contains is None or contains in line]
+
+    def feed(self, line: str):
+        """Dispatch one line to the callbacks registered for its type"""
+        match = self.TYPE_PREFIX.match(line)
+        if match:
+            if match.group(1) not in self.first_seen:
+                self.first_seen[match.group(1)] = time.time()
+            callbacks = self._callbacks(match.group(1), line)
+            if not callbacks:
+                self.skipped += 1
+                return
+
+        try:
+            event = json_loads(line)
+        except ValueError:
+            self.malformed += 1
+            return
+        if not isinstance(event, dict):
+            self.malformed += 1
+            return
+
+        if not match:
+            callbacks = self._callbacks(event.get("type"), line)
+        for callback in callbacks:
+            callback(event)
+
 
 class ClaudeProcessingEngine(ProcessingEngine):
     """Claude CLI implementation of the processing engine"""
 
+    # Flags _run_claude_command depends on
+    REQUIRED_FLAGS = ("--print", "--output-format", "stream-json", "--permission-mode", "--verbose")
+
     def check_availability(self) -> bool:
         """Check if Claude CLI is available"""
         try:
-            subprocess.run(["claude", "--version"], capture_output=True, check=True)
+            subprocess.run(["claude", "--version"], capture_output=True, check=True, stdin=subprocess.DEVNULL)
             return True
         except:
             return False
 
+    def fingerprint(self) -> str:
+        """The resolved CLI binary, so an upgrade or PATH change invalidates cached probes"""
+        import shutil
+
+        executable = shutil.which("claude")
+        if not executable:
+            return "claude:missing"
+        stat = os.stat(executable)
+        return f"claude:{executable}:{stat.st_mtime_ns}:{stat.st_size}"
+
+    def describe(self) -> Dict[str, Any]:
+        """CLI version, where credentials come from, and whether --help lists the flags we use"""
+        details = {'engine': "claude", 'available': False, 'version': None,
+                   'auth': self._auth_source(), 'capabilities': {}}
+        try:
+            version = subprocess.run(["claude", "--version"], capture_output=True, text=True, check=True,
+                                     stdin=subprocess.DEVNULL, timeout=60)
+        except (OSError, subprocess.SubprocessError):
+            return details
+        details['available'] = True
+        details['version'] = version.stdout.strip()
+
+        try:
+            help_text = subprocess.run(["claude", "--help"], capture_output=True, text=True,
+                                       stdin=subprocess.DEVNULL, timeout=60).stdout
+        except (OSError, subprocess.SubprocessError):
+            help_text = ""
+        details['capabilities'] = {flag: flag in help_text for flag in self.REQUIRED_FLAGS}
+        return details
+
+    @staticmethod
+    def _auth_source() -> Optional[str]:
+        """Where the CLI will find credentials, if that can be seen from outside it"""
+        for name in ("ANTHROPIC_API_KEY", "CLAUDE_CODE_OAUTH_TOKEN"):
+            if os.environ.get(name):
+                return f"{name} environment variable"
+        if (Path.home() / ".claude" / ".credentials.json").exists():
+            return "~/.claude/.credentials.json"
+        return None
+
+    def warm_up(self, connections: int = 1):
+        """Run the CLI once so its files are in the page cache before the first item"""
+        self.check_availability()
+
     def process_item(self, prompt: str, log_file: Path) -> ProcessingResult:
         """Process item using Claude CLI"""
         return self._run_claude_command(prompt, log_file, is_synthesis=False)
@@ -91,12 +497,7 @@ class ClaudeProcessingEngine(ProcessingEngine):
             "--verbose",
         ]
         start_time = time.time()
-
-        tokens_used = input_tokens = output_tokens = 0
-        cost_usd = 0.0
-        output_lines = []
-        error_message = None
-        output_data = None
+        stream = self._new_stream_state()
 
         try:
             with open(log_file, "w") as log:
@@ -107,72 +508,415 @@ class ClaudeProcessingEngine(ProcessingEngine):
                     text=True,
                     bufsize=1,
                 )
-                for line in iter(proc.stdout.readline, ""):
-                    log.write(line)
-                    try:
-                        d = json.loads(line.strip())
-                        if d.get("type") == "assistant":
-                            for item in d.get("message", {}).get("content", []):
-                                if item.get("type") == "text" and (
-                                    text := item.get("text", "").strip()
-                                ):
-                                    output_lines.append(text)
-                                    if not is_synthesis:
-                                        print(f"{text}\n---")
-                        elif d.get("type") == "result":
-                            # Final result contains usage and cost information
-                            usage = d.get("usage", {})
-                            if usage:
-                                input_tokens = usage.get("input_tokens", 0) + usage.get(
-                                    "cache_read_input_tokens", 0
-                                )
-                                output_tokens = usage.get("output_tokens", 0)
-                                tokens_used = input_tokens + output_tokens
-                                cost_usd = d.get("total_cost_usd", 0.0)
-                        elif d.get("type") == "assistant" and "usage" in d.get(
-                            "message", {}
-                        ):
-                            # Also check assistant messages for usage data
-                            usage = d["message"]["usage"]
-                            input_tokens = usage.get("input_tokens", 0) + usage.get(
-                                "cache_read_input_tokens", 0
-                            )
-                            output_tokens = usage.get("output_tokens", 0)
-                            tokens_used = input_tokens + output_tokens
-                            # Fallback calculation if no total_cost_usd
-                            if cost_usd == 0.0:
-                                cost_usd = (
-                                    input_tokens * 3.0 + output_tokens * 15.0
-                                ) / 1_000_000
-                    except:
-                        pass
+                self._consume_stream(iter(proc.stdout.readline, ""), log, stream, is_synthesis)
                 proc.wait()
 
-            duration = time.time() - start_time
             success = proc.returncode == 0
-
-            if not success:
-                error_message = f"Claude CLI failed with return code {proc.returncode}"
-            else:
-                output_data = "\n".join(output_lines)
+            error_message = None if success else f"Claude CLI failed with return code {proc.returncode}"
 
         except Exception as e:
-            duration = time.time() - start_time
             success = False
             error_message = f"Failed to execute Claude CLI: {str(e)}"
 
+        return self._stream_result(stream, success, start_time, error_message)
+
+    @staticmethod
+    def _new_stream_state() -> Dict[str, Any]:
+        """Accumulator for one stream-json transcript"""
+        return {
+            'output_lines': [],
+            'input_tokens': 0,
+            'output_tokens': 0,
+            'total_tokens': 0,
+            'cache_read_tokens': 0,
+            'cache_creation_tokens': 0,
+            'cost_usd': 0.0,
+            'first_token_at': None
+        }
+
+    def _consume_stream(self, lines, log, stream: Dict[str, Any], is_synthesis: bool):
+        """Log stream-json lines and accumulate text and usage from them"""
+        parser = StreamEventParser()
+        parser.on("assistant", lambda event: self._on_assistant(event, stream, is_synthesis), contains='"text"')
+        parser.on("result", lambda event: self._on_result(event, stream))
+        for line in lines:
+            log.write(line)
+            parser.feed(line)
+        stream['first_token_at'] = parser.first_seen.get("assistant")
+
+    @staticmethod
+    def _on_assistant(event: Dict[str, Any], stream: Dict[str, Any], is_synthesis: bool):
+        """Collect text blocks from an assistant message"""
+        for item in event.get("message", {}).get("content", []):
+            if item.get("type") == "text" and (text := item.get("text", "").strip()):
+                stream['output_lines'].append(text)
+                if not is_synthesis:
+                    print(f"{text}\n---")
+
+    @staticmethod
+    def _on_result(event: Dict[str, Any], stream: Dict[str, Any]):
+        """Final result contains usage and cost information"""
+        usage = event.get("usage", {})
+        if usage:
+            stream['cache_read_tokens'] = usage.get("cache_read_input_tokens", 0)
+            stream['cache_creation_tokens'] = usage.get("cache_creation_input_tokens", 0)
+            stream['input_tokens'] = usage.get("input_tokens", 0) + stream['cache_read_tokens']
+            stream['output_tokens'] = usage.get("output_tokens", 0)
+            stream['total_tokens'] = stream['input_tokens'] + stream['output_tokens']
+            stream['cost_usd'] = event.get("total_cost_usd", 0.0)
+
+    @staticmethod
+    def _stream_result(stream: Dict[str, Any], success: bool, start_time: float,
+                       error_message: Optional[str]) -> ProcessingResult:
+        """Build the ProcessingResult for a consumed stream"""
+        return ProcessingResult(
+            success=success,
+            output_data="\n".join(stream['output_lines']) if success else None,
+            output_lines=stream['output_lines'],
+            input_tokens=stream['input_tokens'],
+            output_tokens=stream['output_tokens'],
+            total_tokens=stream['total_tokens'],
+            cache_read_tokens=stream['cache_read_tokens'],
+            cache_creation_tokens=stream['cache_creation_tokens'],
+            cost_usd=stream['cost_usd'],
+            duration=time.time() - start_time,
+            time_to_first_token=stream['first_token_at'] - start_time if stream['first_token_at'] else None,
+            error_message=error_message,
+        )
+
+
+class MockProcessingEngine(ClaudeProcessingEngine):
+    """Deterministic stand-in that emits Claude stream-json without calling any model"""
+
+    def __init__(self, mock_config: Dict[str, Any]):
+        import random
+
+        self.latency = mock_config.get('latency_seconds', 0.0)
+        self.jitter = mock_config.get('latency_jitter', 0.0)
+        self.input_tokens = mock_config.get('input_tokens')
+        self.output_tokens = mock_config.get('output_tokens', 800)
+        self.cache_read_ratio = mock_config.get('cache_read_ratio', 0.0)
+        self.failure_rate = mock_config.get('failure_rate', 0.0)
+        self.tool_result_bytes = mock_config.get('tool_result_bytes', 2000)
+        self.echo = mock_config.get('echo', False)
+        self._random = random.Random(mock_config.get('seed', 0))
+
+    def check_availability(self) -> bool:
+        """The mock engine is always available"""
+        return True
+
+    def fingerprint(self) -> str:
+        return "mock"
+
+    def describe(self) -> Dict[str, Any]:
+        return {'engine': "mock", 'available': True, 'version': "mock", 'auth': "not required", 'capabilities': {}}
+
+    def warm_up(self, connections: int = 1):
+        pass
+
+    def _run_claude_command(self, prompt: str, log_file: Path, is_synthesis: bool = False) -> ProcessingResult:
+        """Generate a transcript for the prompt and parse it like real CLI output"""
+        start_time = time.time()
+        delay = self.latency + self._random.uniform(0, self.jitter)
+        failed = self._random.random() < self.failure_rate
+        if delay:
+            time.sleep(delay)
+
+        stream = self._new_stream_state()
+        with open(log_file, "w") as log:
+            self._consume_stream(self._transcript(prompt, is_synthesis, failed), log, stream,
+                                 is_synthesis or not self.echo)
+
+        error_message = "Mock engine injected failure" if failed else None
+        return self._stream_result(stream, not failed, start_time, error_message)
+
+    def _transcript(self, prompt: str, is_synthesis: bool, failed: bool) -> List[str]:
+        """Realistic verbose stream-json lines: init, a tool round-trip, text and the final result"""
+        input_tokens = self.input_tokens if self.input_tokens is not None else estimate_tokens(prompt)
+        cache_read = int(input_tokens * self.cache_read_ratio)
+        text = self._response_text(prompt, is_synthesis)
+
+        events = [
+            {"type": "system", "subtype": "init", "session_id": "mock", "tools": ["Read", "Edit", "Write"]},
+            {"type": "assistant", "message": {"content": [
+                {"type": "tool_use", "id": "toolu_mock", "name": "Read", "input": {"file_path": "mock"}}]}},
+            {"type": "user", "message": {"content": [
+                {"type": "tool_result", "tool_use_id": "toolu_mock", "content": "x" * self.tool_result_bytes}]}},
+            {"type": "assistant", "message": {"content": [{"type": "text", "text": text}]}}
+        ]
+        if not failed:
+            events.append({
+                "type": "result",
+                "subtype": "success",
+                "usage": {
+                    "input_tokens": input_tokens - cache_read,
+                    "cache_read_input_tokens": cache_read,
+                    "cache_creation_input_tokens": 0,
+                    "output_tokens": self.output_tokens
+                },
+                "total_cost_usd": ((input_tokens - cache_read) * 3.0 + cache_read * 0.3
+                                   + self.output_tokens * 15.0) / 1_000_000
+            })
+        return [json.dumps(event) + "\n" for event in events]
+
+    @staticmethod
+    def _response_text(prompt: str, is_synthesis: bool) -> str:
+        """One <analysis> document per item named in the prompt, or a short report"""
+        # Only item header lines; instructions may mention ITEM_PATH with a "(see ...)" reference
+        paths = re.findall(r'^(?:### |- )?(?:ITEM_PATH|FILE_PATH):[ \t]*([^\s(]\S*)', prompt, flags=re.M)
+        if is_synthesis or not paths:
+            return "## Executive Summary\n\nMock synthesis report."
+
+        return "\n".join(
+            f"<analysis><metadata><source_file>{path}</source_file></metadata>"
+            f"<scores><quality>4</quality></scores>"
+            f"<issues><issue><severity>medium</severity><category>quality</category>"
+            f"<description>Mock finding</description><recommendation>None</recommendation></issue></issues>"
+            f"<summary>Mock review of {path}</summary></analysis>"
+            for path in dict.fromkeys(paths)
+        )
+
+
+class HttpProcessingEngine(ProcessingEngine):
+    """Messages-API implementation of the processing engine over pooled keep-alive connections"""
+
+    def __init__(self, http_config: Dict[str, Any]):
+        from urllib.parse import urlsplit
+
+        url = urlsplit(http_config.get('base_url', 'http://127.0.0.1:8765'))
+        self.scheme = url.scheme
+        self.host = url.hostname
+        self.port = url.port
+        self.base_path = url.path.rstrip('/')
+        self.api_format = http_config.get('api_format', 'anthropic')
+        if self.api_format not in ('anthropic', 'openai'):
+            raise ValueError(f"Unsupported HTTP api_format: {self.api_format}")
+        self.model = http_config.get('model', 'claude-sonnet-4-5')
+        self.max_tokens = http_config.get('max_tokens', 8192)
+        self.timeout = http_config.get('timeout', 600)
+        self.api_key_env = http_config.get('api_key_env',
+                                           'ANTHROPIC_API_KEY' if self.api_format == 'anthropic' else 'OPENAI_API_KEY')
+        self.api_key = os.environ.get(self.api_key_env, '')
+        pricing = http_config.get('price_per_mtok', {})
+        self.input_price = pricing.get('input', 3.0)
+        self.output_price = pricing.get('output', 15.0)
+        # Cache reads and writes are billed at their own rates, by default 0.1x and 1.25x input
+        self.cache_read_price = pricing.get('cache_read', self.input_price * 0.1)
+        self.cache_write_price = pricing.get('cache_write', self.input_price * 1.25)
+
+        # Idle connections are reused most-recent-first; the pool only bounds what is kept open
+        self.pool_size = http_config.get('pool_size', 8)
+        self._pool = queue.LifoQueue()
+        self.cache_prefixes: Tuple[str, ...] = ()
+
+    def check_availability(self) -> bool:
+        """Check if the endpoint accepts connections"""
+        connection = self._new_connection()
+        try:
+            connection.request("HEAD", self.base_path or "/")
+            connection.getresponse().read()
+            self._release(connection)
+            return True
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            return False
+
+    def fingerprint(self) -> str:
+        return f"http:{self.scheme}://{self.host}:{self.port}{self.base_path}"
+
+    def describe(self) -> Dict[str, Any]:
+        """Endpoint reachability, server header, API key presence and keep-alive support"""
+        details = {'engine': f"http ({self.api_format}, {self.model})", 'available': False, 'version': None,
+                   'auth': f"{self.api_key_env} environment variable" if self.api_key else None,
+                   'capabilities': {}}
+        connection = self._new_connection()
+        try:
+            connection.request("HEAD", self.base_path or "/")
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            return details
+        details['available'] = True
+        details['version'] = response.getheader("Server")
+        details['capabilities'] = {'keep-alive': not response.will_close}
+        self._release(connection)
+        return details
+
+    def warm_up(self, connections: int = 1):
+        """Open connections ahead of the first requests so they skip the TCP/TLS handshake"""
+        opened = []
+        for _ in range(min(connections, self.pool_size)):
+            connection = self._new_connection()
+            try:
+                connection.request("HEAD", self.base_path or "/")
+                connection.getresponse().read()
+                opened.append(connection)
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                break
+        for connection in opened:
+            self._release(connection)
+
+    def process_item(self, prompt: str, log_file: Path) -> ProcessingResult:
+        """Process item with one streamed request"""
+        return self._stream_request(prompt, log_file, echo=True)
+
+    def synthesize_results(self, prompt: str, log_file: Path) -> ProcessingResult:
+        """Synthesize results with one streamed request"""
+        return self._stream_request(prompt, log_file, echo=False)
+
+    def set_cache_prefixes(self, prefixes: Iterable[str]):
+        """Longest first, so a prompt is split at the most specific prefix it starts with"""
+        self.cache_prefixes = tuple(sorted((prefix for prefix in prefixes if prefix), key=len, reverse=True))
+
+    def _new_connection(self) -> http.client.HTTPConnection:
+        """Open a new connection to the endpoint"""
+        if self.scheme == 'https':
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _acquire(self) -> Tuple[http.client.HTTPConnection, bool]:
+        """Take an idle pooled connection, or open one; the flag tells whether it was reused"""
+        try:
+            return self._pool.get_nowait(), True
+        except queue.Empty:
+            return self._new_connection(), False
+
+    def _release(self, connection: http.client.HTTPConnection):
+        """Return a fully-read connection to the pool"""
+        if self._pool.qsize() < self.pool_size:
+            self._pool.put(connection)
+        else:
+            connection.close()
+
+    def _request_body(self, prompt: str) -> Tuple[str, Dict[str, Any], Dict[str, str]]:
+        """Path, JSON body and headers for the configured API format"""
+        headers = {'Content-Type': 'application/json', 'Connection': 'keep-alive'}
+        body = {
+            'model': self.model,
+            'max_tokens': self.max_tokens,
+            'stream': True,
+            'messages': [{'role': 'user', 'content': prompt}]
+        }
+        if self.api_format == 'anthropic':
+            headers['x-api-key'] = self.api_key
+            headers['anthropic-version'] = '2023-06-01'
+            # The shared prefix goes in its own block with a cache breakpoint; OpenAI caches prefixes implicitly
+            prefix = next((prefix for prefix in self.cache_prefixes if prompt.startswith(prefix)), None)
+            if prefix and len(prompt) > len(prefix):
+                body['messages'][0]['content'] = [
+                    {'type': 'text', 'text': prefix, 'cache_control': {'type': 'ephemeral'}},
+                    {'type': 'text', 'text': prompt[len(prefix):]}
+                ]
+            return f"{self.base_path}/v1/messages", body, headers
+
+        headers['Authorization'] = f"Bearer {self.api_key}"
+        body['stream_options'] = {'include_usage': True}
+        return f"{self.base_path}/v1/chat/completions", body, headers
+
+    def _stream_request(self, prompt: str, log_file: Path, echo: bool) -> ProcessingResult:
+        """Send one streaming request and accumulate text and usage from its server-sent events"""
+        path, body, headers = self._request_body(prompt)
+        payload = json.dumps(body).encode('utf-8')
+        start_time = time.time()
+        error_message = None
+        success = False
+
+        for attempt in range(2):
+            # A retried request starts over, so nothing from the failed attempt carries into it
+            usage = {'input_tokens': 0, 'output_tokens': 0,
+                     'cache_read_input_tokens': 0, 'cache_creation_input_tokens': 0}
+            text_parts: List[str] = []
+            first_token_at = None
+            connection, reused = self._acquire()
+            try:
+                connection.request("POST", path, body=payload, headers=headers)
+                response = connection.getresponse()
+                with open(log_file, "w") as log:
+                    if response.status != 200:
+                        detail = response.read().decode('utf-8', errors='replace')
+                        log.write(detail)
+                        error_message = f"HTTP engine returned {response.status}: {detail[:200]}"
+                    else:
+                        # Reading to EOF leaves the connection clean for reuse
+                        for raw_line in iter(response.readline, b""):
+                            line = raw_line.decode('utf-8', errors='replace')
+                            log.write(line)
+                            if line.startswith("data:"):
+                                self._handle_event(line[5:].strip(), text_parts, usage)
+                                if first_token_at is None and text_parts:
+                                    first_token_at = time.time()
+                        success = True
+                if response.will_close:
+                    connection.close()
+                else:
+                    self._release(connection)
+                break
+            except (OSError, http.client.HTTPException) as e:
+                connection.close()
+                # A pooled connection the server already closed is retried once on a fresh one
+                if reused and attempt == 0:
+                    continue
+                error_message = f"Failed to reach HTTP engine: {str(e)}"
+                break
+
+        output_text = "".join(text_parts).strip()
+        if success and echo and output_text:
+            print(f"{output_text}\n---")
+
+        input_tokens = usage['input_tokens'] + usage['cache_read_input_tokens']
+        output_tokens = usage['output_tokens']
+        cost_usd = (usage['input_tokens'] * self.input_price
+                    + usage['cache_read_input_tokens'] * self.cache_read_price
+                    + usage['cache_creation_input_tokens'] * self.cache_write_price
+                    + output_tokens * self.output_price) / 1_000_000
         return ProcessingResult(
             success=success,
-            output_data=output_data,
-            output_lines=output_lines,
+            output_data=output_text if success else None,
+            output_lines=[output_text] if output_text else [],
             input_tokens=input_tokens,
             output_tokens=output_tokens,
-            total_tokens=tokens_used,
+            total_tokens=input_tokens + output_tokens,
+            cache_read_tokens=usage['cache_read_input_tokens'],
+            cache_creation_tokens=usage['cache_creation_input_tokens'],
             cost_usd=cost_usd,
-            duration=duration,
+            duration=time.time() - start_time,
+            time_to_first_token=first_token_at - start_time if first_token_at else None,
             error_message=error_message,
         )
 
+    def _handle_event(self, data: str, text_parts: List[str], usage: Dict[str, int]):
+        """Fold one server-sent event into the accumulated text and usage"""
+        if not data or data == "[DONE]":
+            return
+        try:
+            event = json_loads(data)
+        except ValueError:
+            return
+
+        if self.api_format == 'anthropic':
+            event_type = event.get('type')
+            if event_type == 'content_block_delta' and event.get('delta', {}).get('type') == 'text_delta':
+                text_parts.append(event['delta'].get('text', ''))
+            elif event_type == 'message_start':
+                for key, value in event.get('message', {}).get('usage', {}).items():
+                    if key in usage and isinstance(value, int):
+                        usage[key] = value
+            elif event_type == 'message_delta':
+                usage['output_tokens'] = event.get('usage', {}).get('output_tokens', usage['output_tokens'])
+            return
+
+        for choice in event.get('choices') or []:
+            content = (choice.get('delta') or {}).get('content')
+            if content:
+                text_parts.append(content)
+        if event.get('usage'):
+            cached = (event['usage'].get('prompt_tokens_details') or {}).get('cached_tokens', 0)
+            usage['input_tokens'] = event['usage'].get('prompt_tokens', 0) - cached
+            usage['cache_read_input_tokens'] = cached
+            usage['output_tokens'] = event['usage'].get('completion_tokens', 0)
+
 
 class ConfigLoader:
     """Configuration loader and validator"""
@@ -203,9 +947,9 @@ class ConfigLoader:
             if section_name not in config:
                 raise ValueError(f"Missing required configuration section: {section_name}")
             section = config[section_name]
-            for field in fields:
-                if field not in section:
-                    raise ValueError(f"Missing required {section_name} field: {field}")
+            for field_name in fields:
+                if field_name not in section:
+                    raise ValueError(f"Missing required {section_name} field: {field_name}")
         return True
 
 
@@ -227,48 +971,2169 @@ class TemplateEngine:
         return re.findall(r'\{([^}]+)\}', template)
 
 
+# Per-item instructions on how results and context updates come back; {context_update_rules} is filled from config
+INLINE_RESPONSE_FORMAT = """
+
+## Response Format
+Do not create or edit any files. Respond with exactly one complete XML document for this item, as a single
+<analysis> element following the Output Requirements. If your review revealed project-wide patterns worth
+adding to the global context, follow it with a <context_updates> element containing markdown, using
+`### <Section Name>` headings followed by `- ` bullet entries. {context_update_rules}"""
+
+# Batched prompts carry their own Response Format, so inline mode only adds where context updates go
+INLINE_BATCH_UPDATE_INSTRUCTIONS = """
+
+## Global Context Update Instructions
+If your review revealed project-wide patterns worth adding to the global context, add a single
+<context_updates> element after the last <analysis> document, never inside one. It contains markdown,
+using `### <Section Name>` headings followed by `- ` bullet entries. {context_update_rules}"""
+
+APPEND_LOG_UPDATE_INSTRUCTIONS = """
+
+## Global Context Update Instructions
+After you have completed your review, do NOT edit the global context file. Instead write any new findings to
+{context_update_file} as markdown, using `### <Section Name>` headings followed by `- ` bullet entries.
+{context_update_rules}"""
+
+IN_PLACE_UPDATE_INSTRUCTIONS = """
+
+## Global Context Update Instructions
+After you have completed your review, update the global context file with your findings.
+{context_update_rules}"""
+
+
+@dataclass
+class PromptPlan:
+    """Item-invariant prompt fragments, precomputed once per run"""
+    static_prefix: str
+    item_template: str
+    update_instructions: str
+    context_file: str
+    layout: str = 'template'
+    batch_prefix: str = ""
+    chunk_prefix: str = ""
+
+    # Template variables that change from one item to the next
+    ITEM_VARIABLES = ('item_path', 'item_data', 'output_file', 'global_context', 'context_update_file')
+
+    # Section titles used when static fragments are hoisted ahead of the item
+    STATIC_SECTIONS = {
+        'assessment_instructions': 'Assessment Process',
+        'output_requirements': 'Output Requirements'
+    }
+
+    BATCH_RESPONSE_FORMAT = """## Response Format
+You are reviewing several items at once. Review each item independently and apply the Assessment Process
+to every one of them. Do not create or edit any result files. Instead respond with one complete XML document
+per item, one after another, each wrapped as:
+
+<analysis>
+  <metadata>
+    <source_file>ITEM_PATH exactly as listed</source_file>
+    ...
+  </metadata>
+  ...
+</analysis>
+
+Emit exactly one <analysis> element per listed item and nothing else between them.
+
+"""
+
+    CHUNK_RESPONSE_FORMAT = """## Response Format
+You are reviewing one chunk of a larger item; other chunks are reviewed separately and merged afterwards.
+Apply the Assessment Process to this chunk only and report line numbers relative to the whole item.
+Do not create or edit any result files. Instead respond with exactly one complete XML document:
+
+<analysis>
+  <metadata>
+    <source_file>ITEM_PATH</source_file>
+    ...
+  </metadata>
+  ...
+</analysis>
+
+"""
+
+    @classmethod
+    def build(cls, template: str, static_variables: Dict[str, Any], update_instructions: str,
+              context_file: str, layout: str = 'template',
+              batch_update_instructions: Optional[str] = None) -> 'PromptPlan':
+        """Pre-render static variables and split off the stable prefix
+
+        batch_update_instructions replaces update_instructions in batched and chunked prompts,
+        which always answer with one <analysis> per item.
+        """
+        if layout == 'static_first':
+            plan = cls._build_static_first(template, static_variables, update_instructions, context_file)
+        elif layout == 'template':
+            plan = cls._build_template(template, static_variables, update_instructions, context_file)
+        else:
+            raise ValueError(f"Unsupported prompt layout: {layout}")
+
+        # Batched and chunked prompts always use the static-first ordering
+        if batch_update_instructions is None:
+            batch_update_instructions = update_instructions
+        plan.batch_prefix = (cls._shared_instructions(template, static_variables, "Items")
+                             + cls._hoisted_update_instructions(batch_update_instructions, "Items")
+                             + cls.BATCH_RESPONSE_FORMAT)
+
+        # Chunks run in parallel, so they only contribute context through per-chunk update files
+        chunk_updates = ""
+        if '{context_update_file}' in batch_update_instructions:
+            chunk_updates = cls._hoisted_update_instructions(batch_update_instructions, "Chunk")
+        plan.chunk_prefix = (cls._shared_instructions(template, static_variables, "Chunk")
+                             + chunk_updates + cls.CHUNK_RESPONSE_FORMAT)
+        return plan
+
+    @classmethod
+    def _shared_instructions(cls, template: str, static_variables: Dict[str, Any], section: str) -> str:
+        """Processing template with per-item placeholders pointing at the given section"""
+        references = dict(static_variables,
+                          item_path=f"(see ITEM_PATH in the {section} section below)",
+                          item_data=f"(see the {section} section below)",
+                          output_file="(returned inline, see Response Format below)",
+                          global_context="(see Global Context below)",
+                          context_update_file=f"the CONTEXT_UPDATE_FILE given in the {section} section")
+        rendered = TemplateEngine.render_template(template, references).strip()
+
+        # Rubric sections the template does not place itself are still carried along
+        missing = {name: value for name, value in static_variables.items()
+                   if name in cls.STATIC_SECTIONS and f"{{{name}}}" not in template}
+        return rendered + "\n\n" + cls._static_sections(missing)
+
+    @classmethod
+    def _build_template(cls, template: str, static_variables: Dict[str, Any], update_instructions: str,
+                        context_file: str) -> 'PromptPlan':
+        """Follow the processing template as written"""
+        rendered = TemplateEngine.render_template(template, static_variables)
+
+        # Everything before the first per-item placeholder is identical for every item
+        positions = [rendered.find(f"{{{name}}}") for name in cls.ITEM_VARIABLES]
+        split_at = min((pos for pos in positions if pos >= 0), default=len(rendered))
+
+        return cls(
+            static_prefix=rendered[:split_at],
+            item_template=rendered[split_at:],
+            update_instructions=update_instructions,
+            context_file=context_file
+        )
+
+    @classmethod
+    def _build_static_first(cls, template: str, static_variables: Dict[str, Any], update_instructions: str,
+                            context_file: str) -> 'PromptPlan':
+        """Hoist rubric, output requirements and update rules ahead of all per-item data"""
+        prefix = cls._static_sections(static_variables) + cls._hoisted_update_instructions(update_instructions, "Item")
+        references = dict(static_variables)
+        for name, title in cls.STATIC_SECTIONS.items():
+            if name in static_variables:
+                references[name] = f"(see {title} above)"
+
+        return cls(
+            static_prefix=prefix,
+            item_template=TemplateEngine.render_template(template, references),
+            update_instructions="",
+            context_file=context_file,
+            layout='static_first'
+        )
+
+    @classmethod
+    def _static_sections(cls, static_variables: Dict[str, Any]) -> str:
+        """Rubric and output requirements as standalone sections"""
+        return "".join(f"## {title}\n{static_variables[name]}\n\n"
+                       for name, title in cls.STATIC_SECTIONS.items() if name in static_variables)
+
+    @staticmethod
+    def _hoisted_update_instructions(update_instructions: str, section: str) -> str:
+        """Update instructions that point at the per-item update file instead of naming it"""
+        return TemplateEngine.render_template(
+            update_instructions.strip(),
+            {'context_update_file': f"the CONTEXT_UPDATE_FILE given in the {section} section"}
+        ) + "\n\n"
+
+    @TRACER.traced("prompt.render_batch")
+    def render_batch(self, items: List[Tuple[Dict[str, Any], str]], global_context: str,
+                     context_update_file: Optional[str] = None) -> str:
+        """Render one prompt covering several small items, given as (item, content) pairs"""
+        lines = [f"## Global Context\n{global_context}\n", f"## Items ({len(items)})"]
+        if context_update_file:
+            lines.append(f"- CONTEXT_UPDATE_FILE: {context_update_file}")
+        for item, content in items:
+            item_data = json.dumps(item, indent=2, default=Item.to_dict)
+            lines.append(f"\n### ITEM_PATH: {item['path']}\n{item_data}\n\nContent:\n```\n{content}\n```")
+        return self.batch_prefix + "\n".join(lines)
+
+    @TRACER.traced("prompt.render_chunk")
+    def render_chunk(self, item: Dict[str, Any], chunk: 'ItemChunk', chunk_count: int, global_context: str,
+                     context_update_file: Optional[str] = None) -> str:
+        """Render the prompt for one chunk of an oversized item"""
+        lines = [
+            f"## Global Context\n{global_context}\n",
+            f"## Chunk {chunk.index + 1} of {chunk_count}",
+            f"- ITEM_PATH: {item['path']}",
+            f"- LINES: {chunk.start_line}-{chunk.end_line}"
+        ]
+        if context_update_file:
+            lines.append(f"- CONTEXT_UPDATE_FILE: {context_update_file}")
+        lines.append(f"\nContent:\n```\n{chunk.content}\n```")
+        return self.chunk_prefix + "\n".join(lines)
+
+    @TRACER.traced("prompt.render")
+    def render(self, item_variables: Dict[str, Any]) -> str:
+        """Render the prompt for one item"""
+        if self.layout == 'static_first':
+            # Global context changes slowly, so it sits between the static prefix and the item
+            context = item_variables.get('global_context', '')
+            update_file = item_variables.get('context_update_file')
+            item_variables = dict(item_variables, global_context="(see Global Context above)")
+            return (self.static_prefix
+                    + f"## Global Context\n{context}\n\n## Item\n"
+                    + (f"- CONTEXT_UPDATE_FILE: {update_file}\n" if update_file else "")
+                    + TemplateEngine.render_template(self.item_template, item_variables)
+                    + self._item_content(item_variables))
+
+        return (self.static_prefix
+                + TemplateEngine.render_template(self.item_template, item_variables)
+                + self._item_content(item_variables)
+                + TemplateEngine.render_template(self.update_instructions, item_variables))
+
+    @staticmethod
+    def _item_content(item_variables: Dict[str, Any]) -> str:
+        """Inlined item content, so the agent does not need a tool call to read it"""
+        if 'item_content' not in item_variables:
+            return ""
+        return f"\n\n## Item Content\n```\n{item_variables['item_content']}\n```"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (about four characters per token)"""
+    return len(text) // 4
+
+
+@dataclass
+class ContextSection:
+    """One named section of the global context scratchsheet"""
+    name: str
+    description: str = ""
+    entries: List[str] = field(default_factory=list)
+
+
+class ContextIndex:
+    """Local BM25 index over global context entries"""
+
+    STOPWORDS = {'the', 'and', 'for', 'are', 'with', 'that', 'this', 'use', 'uses', 'from', 'not', 'all',
+                 'any', 'should', 'when', 'into', 'have', 'has', 'be', 'is', 'in', 'of', 'to', 'a', 'an', 'or'}
+
+    def __init__(self, documents: List[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_terms: List[Dict[str, int]] = []
+        self.doc_lengths: List[int] = []
+        self.doc_freq: Dict[str, int] = {}
+
+        for document in documents:
+            counts: Dict[str, int] = {}
+            tokens = self.tokenize(document)
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token in counts:
+                self.doc_freq[token] = self.doc_freq.get(token, 0) + 1
+            self.doc_terms.append(counts)
+            self.doc_lengths.append(len(tokens))
+
+        self.avg_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+
+    @classmethod
+    def tokenize(cls, text: str) -> List[str]:
+        """Lowercase word tokens, splitting camelCase and snake_case identifiers"""
+        text = re.sub(r'([a-z0-9])([A-Z])', r'\1 \2', text)
+        return [t for t in re.findall(r'[a-z0-9+#]+', text.lower().replace('_', ' '))
+                if len(t) > 1 and t not in cls.STOPWORDS]
+
+    def scores(self, query_terms: List[str]) -> List[float]:
+        """BM25 score of every document for the query"""
+        total = len(self.doc_terms)
+        weights = {}
+        for term in set(query_terms):
+            df = self.doc_freq.get(term)
+            if df:
+                weights[term] = math.log(1 + (total - df + 0.5) / (df + 0.5))
+
+        scores = []
+        for counts, length in zip(self.doc_terms, self.doc_lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / self.avg_length) if self.avg_length else self.k1
+            for term, weight in weights.items():
+                tf = counts.get(term)
+                if tf:
+                    score += weight * tf * (self.k1 + 1) / (tf + norm)
+            scores.append(score)
+        return scores
+
+
+class ItemFile:
+    """An item's bytes, read once and shared by line counting, hashing, sniffing and prompt text
+
+    Large files are memory-mapped, so every consumer works on the same page-cache pages; small
+    files are read in one call, which is cheaper than setting up a mapping.
+    """
+
+    MMAP_MIN_BYTES = 256 * 1024
+    CHUNK_BYTES = 1 << 20
+    SNIFF_BYTES = 64 * 1024
+    BOMS = ((b"\xef\xbb\xbf", 'utf-8-sig'), (b"\xff\xfe\x00\x00", 'utf-32-le'), (b"\x00\x00\xfe\xff", 'utf-32-be'),
+            (b"\xff\xfe", 'utf-16-le'), (b"\xfe\xff", 'utf-16-be'))
+    DECISION_POINTS = re.compile(
+        rb"\b(?:if|elif|elsif|for|foreach|while|until|unless|case|when|catch|except)\b|&&|\|\|")
+    SHEBANG_LANGUAGES = {'python': 'Py', 'node': 'Js', 'deno': 'Ts', 'bash': 'Sh', 'sh': 'Sh', 'zsh': 'Sh',
+                         'ruby': 'Rb', 'perl': 'Pl', 'php': 'Php'}
+
+    def __init__(self, path: str, git_objects: Optional['GitObjects'] = None, blob: Optional[str] = None):
+        self.path = path
+        # With a blob id and a GitObjects reader, content comes from the object database instead of the disk
+        self.git_objects = git_objects
+        self.blob = blob
+        self._data: Any = None
+        self._head = b""
+        self._head_is_whole_file = False
+        self._encoding: Optional[str] = None
+
+    def __enter__(self) -> 'ItemFile':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def data(self) -> Any:
+        """The file's bytes: a read-only mmap for large files, bytes otherwise"""
+        if self._data is None and self.git_objects is not None:
+            self._data = self.git_objects.read(self.blob)
+        elif self._data is None:
+            with open(self.path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size >= self.MMAP_MIN_BYTES:
+                    import mmap
+
+                    try:
+                        # The mapping outlives the descriptor, so the file can be closed right away
+                        self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    except (OSError, ValueError):
+                        self._data = f.read()
+                else:
+                    self._data = f.read()
+        return self._data
+
+    def head_bytes(self, max_bytes: int) -> bytes:
+        """Leading bytes, read on their own so sniffing a file does not load all of it"""
+        if self._data is not None or self.git_objects is not None:
+            return bytes(self.data()[:max_bytes])
+        if len(self._head) < max_bytes and not self._head_is_whole_file:
+            with open(self.path, 'rb') as f:
+                self._head = f.read(max_bytes)
+            self._head_is_whole_file = len(self._head) < max_bytes
+        return self._head[:max_bytes]
+
+    def _chunks(self) -> Iterator[bytes]:
+        data = self.data()
+        if isinstance(data, bytes):
+            yield data
+            return
+        for start in range(0, len(data), self.CHUNK_BYTES):
+            yield data[start:start + self.CHUNK_BYTES]
+
+    def line_count(self) -> int:
+        """Lines as text-mode iteration counts them: \\n, \\r\\n and lone \\r all end a line
+
+        Counted on raw bytes, so undecodable bytes are never dropped and cannot fuse a \\r with a later \\n.
+        """
+        lines = 0
+        previous = b""
+        for chunk in self._chunks():
+            lines += chunk.count(b"\n") + chunk.count(b"\r") - chunk.count(b"\r\n")
+            if previous == b"\r" and chunk[:1] == b"\n":
+                # A \r\n split across chunks was counted twice
+                lines -= 1
+            previous = chunk[-1:]
+        if previous and previous not in (b"\n", b"\r"):
+            lines += 1
+        return lines
+
+    def sha256(self) -> str:
+        import hashlib
+
+        return hashlib.sha256(self.data()).hexdigest()
+
+    def encoding(self) -> str:
+        """BOM-declared encoding, else utf-8 if the head decodes, 'binary' if it holds NULs, else latin-1"""
+        if self._encoding is None:
+            head = self.head_bytes(self.SNIFF_BYTES)
+            self._encoding = next((name for bom, name in self.BOMS if head.startswith(bom)), None)
+            if self._encoding is None:
+                import codecs
+
+                try:
+                    # Incremental, so a character cut off at the sniff boundary is not an error
+                    codecs.getincrementaldecoder('utf-8')().decode(head, final=len(head) < self.SNIFF_BYTES)
+                    self._encoding = 'utf-8'
+                except UnicodeDecodeError:
+                    self._encoding = 'binary' if b"\0" in head else 'latin-1'
+        return self._encoding
+
+    def language(self) -> str:
+        """Interpreter named by a shebang line, else the extension as file_extension.title() gives it"""
+        data = self.head_bytes(256)
+        if data[:2] == b"#!":
+            words = data[2:].split(b"\n", 1)[0].decode('utf-8', errors='ignore').split()
+            if words:
+                interpreter = Path(words[1] if Path(words[0]).name == 'env' and len(words) > 1 else words[0]).name
+                interpreter = interpreter.rstrip('0123456789.')
+                if interpreter in self.SHEBANG_LANGUAGES:
+                    return self.SHEBANG_LANGUAGES[interpreter]
+        return Path(self.path).suffix[1:].title()
+
+    def text(self) -> str:
+        """Whole file as the prompt sees it: text-mode decoding with undecodable bytes dropped"""
+        encoding = self.encoding()
+        # utf-8 with errors ignored is what text-mode reads always gave; BOMs now pick their codec
+        text = str(self.data(), encoding if encoding not in ('binary', 'latin-1') else 'utf-8', 'ignore')
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        return text
+
+    def head(self, max_bytes: int) -> str:
+        return self.head_bytes(max_bytes).decode('utf-8', errors='ignore')
+
+    def complexity(self) -> int:
+        """Cyclomatic-style estimate: 1 + branch keywords and short-circuit operators, comments and strings included"""
+        return 1 + len(self.DECISION_POINTS.findall(self.data()))
+
+    def close(self):
+        if self._data is not None and not isinstance(self._data, bytes):
+            self._data.close()
+        self._data = None
+        self._head = b""
+        self._head_is_whole_file = False
+
+
+class GitObjects:
+    """Bulk access to git's object database: blob sizes, worktree hashes and blob contents
+
+    Contents are read through one long-lived `git cat-file --batch` process shared by all threads.
+    """
+
+    def __init__(self):
+        self._process: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def sizes(blobs: Iterable[str]) -> Dict[str, int]:
+        """Sizes of many blobs from a single `git cat-file --batch-check`"""
+        request = "\n".join(dict.fromkeys(blobs))
+        if not request:
+            return {}
+        output = subprocess.run(['git', 'cat-file', '--batch-check'], input=request + "\n",
+                                capture_output=True, text=True, check=True).stdout
+        sizes = {}
+        for line in output.splitlines():
+            blob, kind, size = line.split(' ', 2) if line.count(' ') == 2 else (line, 'missing', '0')
+            if kind == 'blob':
+                sizes[blob] = int(size)
+        return sizes
+
+    @staticmethod
+    def hash_files(paths: List[str]) -> Dict[str, str]:
+        """Blob ids of worktree files as git would store them, from a single `git hash-object`"""
+        # --stdin-paths is newline separated, so a path containing one is left unhashed
+        paths = [path for path in paths if "\n" not in path]
+        if not paths:
+            return {}
+        request = b"\n".join(os.fsencode(path) for path in paths) + b"\n"
+        output = subprocess.run(['git', 'hash-object', '--stdin-paths'], input=request,
+                                capture_output=True, check=True).stdout
+        return dict(zip(paths, output.decode('ascii').split()))
+
+    def read(self, blob: str) -> bytes:
+        """Contents of one blob"""
+        with self._lock:
+            if self._process is None or self._process.poll() is not None:
+                self._process = subprocess.Popen(['git', 'cat-file', '--batch'], stdin=subprocess.PIPE,
+                                                 stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            self._process.stdin.write(blob.encode('ascii') + b"\n")
+            self._process.stdin.flush()
+            header = self._process.stdout.readline().split()
+            if len(header) != 3:
+                raise FileNotFoundError(f"git object {blob} not found")
+            size = int(header[2])
+            # Contents are followed by a newline
+            return self._process.stdout.read(size + 1)[:size]
+
+    def close(self):
+        if self._process is not None:
+            self._process.stdin.close()
+            self._process.wait()
+            self._process = None
+
+
+class GitHistory:
+    """Per-file last author, last commit time and commit count, read in one `git log --name-only` pass"""
+
+    def __init__(self, files: Dict[str, Tuple[str, int, int]]):
+        self.files = files
+
+    @classmethod
+    def read(cls, rev: str = 'HEAD', since: Optional[str] = None) -> 'GitHistory':
+        """History of rev, newest first, with paths relative to the working directory like ls-files"""
+        cmd = ['git', 'log', '-z', '--name-only', '--no-renames', '--relative', '--format=%x01%aN%x00%at']
+        if since:
+            cmd.append(f"--since={since}")
+        cmd += [rev, '--']
+
+        entries: Dict[bytes, List[Any]] = {}
+
+        def add(commit: bytes):
+            author, timestamp, names = commit.split(b"\0", 2)
+            for name in names.lstrip(b"\n").split(b"\0"):
+                if not name:
+                    continue
+                entry = entries.get(name)
+                if entry is None:
+                    # Newest commit first, so the first sighting holds the last author and time
+                    entries[name] = [author, int(timestamp), 1]
+                else:
+                    entry[2] += 1
+
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as proc:
+            pending = b""
+            while block := proc.stdout.read(1 << 20):
+                commits = (pending + block).split(b"\x01")
+                pending = commits.pop()
+                for commit in commits:
+                    if commit:
+                        add(commit)
+            if pending:
+                add(pending)
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+        authors: Dict[bytes, str] = {}
+        return cls({name.decode(errors='surrogateescape'):
+                    (authors.setdefault(author, author.decode(errors='replace')), timestamp, commits)
+                    for name, (author, timestamp, commits) in entries.items()})
+
+    def author(self, path: str) -> Optional[str]:
+        entry = self.files.get(path)
+        return entry[0] if entry else None
+
+    def last_commit(self, path: str) -> Optional[str]:
+        entry = self.files.get(path)
+        return datetime.fromtimestamp(entry[1], timezone.utc).isoformat() if entry else None
+
+    def churn(self, path: str) -> int:
+        entry = self.files.get(path)
+        return entry[2] if entry else 0
+
+
+class ContentSniffer:
+    """Flags items whose content is not worth mapping: binaries, minified bundles, generated code, lockfiles
+
+    Only the head of each file is read. classify() returns the reason an item was flagged, or None.
+    """
+
+    GENERATED_MARKERS = (b"@generated", b"do not edit", b"code generated by", b"autogenerated", b"auto-generated",
+                         b"automatically generated", b"generated by the protocol buffer compiler")
+    LOCKFILE_NAMES = ('package-lock.json', 'npm-shrinkwrap.json', 'yarn.lock', 'pnpm-lock.yaml', 'bun.lockb',
+                      'Cargo.lock', 'poetry.lock', 'Pipfile.lock', 'uv.lock', 'Gemfile.lock', 'composer.lock',
+                      'go.sum', 'packages.lock.json', 'Podfile.lock', 'flake.lock')
+    # Control bytes other than backspace, tab, newline, form feed, carriage return and escape
+    CONTROL_BYTES = bytes(set(range(32)) - {8, 9, 10, 12, 13, 27}) + b"\x7f"
+
+    def __init__(self, content_filter_config: Dict[str, Any]):
+        self.action = content_filter_config.get('action', 'tag')
+        if self.action not in ('tag', 'drop'):
+            raise ValueError(f"Unsupported content_filter action: {self.action}")
+        self.sniff_bytes = content_filter_config.get('sniff_bytes', 8192)
+        self.max_entropy = content_filter_config.get('max_entropy_bits', 7.0)
+        self.max_control_ratio = content_filter_config.get('max_control_ratio', 0.1)
+        self.max_line_length = content_filter_config.get('max_line_length', 5000)
+        self.max_mean_line_length = content_filter_config.get('max_mean_line_length', 300)
+        self.marker_lines = content_filter_config.get('generated_marker_lines', 5)
+        self.markers = tuple(marker.lower().encode('utf-8')
+                             for marker in content_filter_config.get('generated_markers', [])) or self.GENERATED_MARKERS
+        self.lockfile_names = frozenset(content_filter_config.get('lockfile_names', self.LOCKFILE_NAMES))
+        self.workers = content_filter_config.get('workers', min(32, (os.cpu_count() or 1) + 4))
+
+    def classify(self, item_file: ItemFile) -> Optional[str]:
+        """'lockfile', 'binary', 'generated' or 'minified' when the item should not be mapped"""
+        if os.path.basename(item_file.path) in self.lockfile_names:
+            return 'lockfile'
+
+        head = item_file.head_bytes(self.sniff_bytes)
+        if not head:
+            return None
+        encoding = item_file.encoding()
+        # UTF-16 and UTF-32 text is full of NULs, so only single-byte encodings get the byte-level checks
+        if not encoding.startswith(('utf-16', 'utf-32')):
+            if b"\0" in head:
+                return 'binary'
+            if len(head) - len(head.translate(None, self.CONTROL_BYTES)) > self.max_control_ratio * len(head):
+                return 'binary'
+            if len(head) >= 1024 and encoding != 'utf-8' and self._entropy(head) > self.max_entropy:
+                return 'binary'
+
+        lines = head.split(b"\n")
+        top = b"\n".join(lines[:self.marker_lines]).lower()
+        if any(marker in top for marker in self.markers):
+            return 'generated'
+
+        # The last line may be cut off at sniff_bytes, which still says the file has a very long line
+        if max(map(len, lines)) > self.max_line_length:
+            return 'minified'
+        if len(head) >= 1024 and len(head) / len(lines) > self.max_mean_line_length:
+            return 'minified'
+        return None
+
+    @staticmethod
+    def _entropy(data: bytes) -> float:
+        """Shannon entropy in bits per byte"""
+        from collections import Counter
+
+        total = len(data)
+        return -sum(count / total * math.log2(count / total) for count in Counter(data).values())
+
+
+class GlobalContextManager:
+    """Keeps the global context scratchsheet compact and within a token budget"""
+
+    # Names per extension; an entry is tied to a language only by an explicit tag such as [python]
+    # or an extension token such as *.py, never by these words appearing in its prose
+    LANGUAGE_ALIASES = {
+        'py': ['python', 'py', 'pip', 'pytest', 'django', 'flask'],
+        'js': ['javascript', 'js', 'node', 'nodejs', 'npm'],
+        'jsx': ['javascript', 'jsx', 'react'],
+        'ts': ['typescript', 'ts'],
+        'tsx': ['typescript', 'tsx', 'react'],
+        'go': ['go', 'golang'],
+        'rs': ['rust', 'rs', 'cargo'],
+        'java': ['java', 'maven', 'gradle'],
+        'kt': ['kotlin', 'kt'],
+        'rb': ['ruby', 'rb', 'rails'],
+        'php': ['php'],
+        'c': ['c'],
+        'cpp': ['cpp', 'c++'],
+        'cs': ['csharp', 'c#', 'dotnet'],
+        'swift': ['swift'],
+        'sh': ['shell', 'bash', 'sh'],
+        'sql': ['sql'],
+        'md': ['markdown', 'md']
+    }
+
+    LANGUAGE_TAG = re.compile(r'\[([a-z0-9+#]+)\]|(?<![\w.])\*?\.([a-z0-9+]+)(?![\w.])')
+    FENCES = ('```', '~~~')
+    GENERAL_SECTION = "General Notes"
+    PLACEHOLDERS = {'tbd', 'none yet', 'n/a'}
+
+    def __init__(self, context_path: Path, context_config: Dict[str, Any]):
+        self.context_path = context_path
+        # Budgeting is opt-in; without max_tokens every prompt gets the whole scratchsheet
+        self.max_tokens = context_config.get('max_tokens', 0)
+        self.compact_threshold = context_config.get('compact_threshold_tokens', self.max_tokens * 2)
+        self.max_entries_per_section = context_config.get('max_entries_per_section', 50)
+        self.configured_sections = [s['name'] for s in context_config.get('sections', [])]
+
+        # 'sections' keeps language/directory-tagged entries; 'bm25' ranks every entry against the item
+        self.retrieval = context_config.get('retrieval', 'sections')
+        if self.retrieval not in ('sections', 'bm25'):
+            raise ValueError(f"Unsupported global context retrieval: {self.retrieval}")
+        self.top_k = context_config.get('top_k', 20)
+        self._index_cache: Optional[Tuple[int, List[ContextSection], ContextIndex]] = None
+
+        # In append_log mode workers never touch the scratchsheet; a single merger folds the log in
+        self.update_mode = context_config.get('update_mode', 'in_place')
+        if self.update_mode not in ('in_place', 'append_log'):
+            raise ValueError(f"Unsupported global context update mode: {self.update_mode}")
+        self.merge_every = context_config.get('merge_every', 10)
+        self.updates_dir = context_path.parent / "context_updates"
+        self.log_path = context_path.parent / "context_updates.jsonl"
+        self.state_path = context_path.with_name(context_path.name + ".state.json")
+        self.lock_path = context_path.with_name(context_path.name + ".lock")
+
+    def parse(self, text: str) -> Tuple[List[str], List[ContextSection]]:
+        """Split the scratchsheet into a title block and merged, deduplicated sections
+
+        An entry is a top-level line with its indented continuation (nested bullets, wrapped
+        text, indented code), or a whole fenced code block; multi-line entries are kept verbatim.
+        """
+        title_lines = []
+        sections: Dict[str, ContextSection] = {}
+        seen: Dict[str, Dict[str, str]] = {}
+        current = None
+        block: List[str] = []
+        fence = None
+        fence_is_entry = False
+
+        def flush():
+            if block and current is not None:
+                entry = "\n".join(block)
+                key = re.sub(r'\s+', ' ', entry.lower()).strip().rstrip('.;')
+                if key and key not in self.PLACEHOLDERS:
+                    # A repeated entry moves to the end so it counts as recent
+                    seen[current].pop(key, None)
+                    seen[current][key] = entry
+            block.clear()
+
+        for raw_line in text.splitlines():
+            line = raw_line.strip()
+            if fence:
+                block.append(raw_line.rstrip())
+                if line.startswith(fence):
+                    fence = None
+                    if fence_is_entry:
+                        flush()
+                continue
+
+            nested = bool(block) and raw_line[:1].isspace()
+            if current is not None and line.startswith(self.FENCES):
+                # A fence under an entry belongs to it; a top-level fence is an entry of its own
+                fence, fence_is_entry = line[:3], not nested
+                if fence_is_entry:
+                    flush()
+                block.append(raw_line.rstrip())
+                continue
+
+            heading = re.match(r'^(#{1,6})\s+(.*)$', line)
+            if heading:
+                flush()
+                level, name = len(heading.group(1)), heading.group(2).strip()
+                if level == 1 and not sections:
+                    title_lines.append(line)
+                    continue
+                # Agent update headers only group entries; fold them into the named sections
+                if name.lower().startswith('update from'):
+                    current = self.GENERAL_SECTION
+                else:
+                    current = name
+                if current not in sections:
+                    sections[current] = ContextSection(current)
+                    seen[current] = {}
+                continue
+
+            if not line or current is None:
+                continue
+            if nested:
+                block.append(raw_line.rstrip())
+                continue
+            flush()
+            if line == '---':
+                continue
+            if line.startswith('*') and line.endswith('*') and not line.startswith('* '):
+                if not sections[current].description:
+                    sections[current].description = line.strip('*').strip()
+                continue
+            block.append(re.sub(r'^([-*+]|\d+\.)\s+', '', line))
+        flush()
+
+        for name, section in sections.items():
+            section.entries = list(seen[name].values())
+        return title_lines, list(sections.values())
+
+    @classmethod
+    def render_entry(cls, entry: str) -> str:
+        """Markdown for one entry: a bullet, or the fenced block as written"""
+        return entry if entry.startswith(cls.FENCES) else f"- {entry}"
+
+    def load(self) -> str:
+        """Read the scratchsheet, compacting it first if it outgrew its threshold"""
+        with open(self.context_path, 'r') as f:
+            text = f.read()
+
+        # Only the merger rewrites the scratchsheet when updates go through the log
+        if self.update_mode == 'in_place' and self.compact_threshold and estimate_tokens(text) > self.compact_threshold:
+            text = self.compact(text)
+
+        return text
+
+    @TRACER.traced("context.compact")
+    def compact(self, text: Optional[str] = None) -> str:
+        """Rewrite the scratchsheet as deduplicated per-section summaries"""
+        if text is None:
+            with open(self.context_path, 'r') as f:
+                text = f.read()
+
+        title_lines, sections = self.parse(text)
+        by_name = {section.name: section for section in sections}
+        for name in self.configured_sections:
+            by_name.setdefault(name, ContextSection(name))
+
+        ordered = [by_name[name] for name in self.configured_sections]
+        ordered += [s for s in sections if s.name not in self.configured_sections and s.entries]
+
+        lines = title_lines + [""] if title_lines else []
+        for section in ordered:
+            lines.append(f"### {section.name}")
+            if section.description:
+                lines.append(f"*{section.description}*")
+                lines.append("")
+            # Keep the most recent entries when a section overflows
+            entries = section.entries[-self.max_entries_per_section:] or ["TBD"]
+            lines.extend(self.render_entry(entry) for entry in entries)
+            lines.append("")
+
+        compacted = "\n".join(lines).rstrip() + "\n"
+
+        # Write-then-rename so concurrent readers always see a whole snapshot
+        tmp_path = self.context_path.with_name(self.context_path.name + f".{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            f.write(compacted)
+        os.replace(tmp_path, self.context_path)
+
+        return compacted
+
+    def update_file_for(self, item_path: str) -> Path:
+        """Per-item file the agent writes its context updates to"""
+        return self.updates_dir / (item_path.replace('/', '__').replace('\\', '__') + ".md")
+
+    def snapshot_version(self) -> int:
+        """Version of the scratchsheet snapshot currently on disk"""
+        return self._read_state().get('version', 0)
+
+    def apply_update(self, item_path: str, markdown: str):
+        """Apply context updates returned inline by the engine"""
+        if self.update_mode == 'append_log':
+            self.updates_dir.mkdir(parents=True, exist_ok=True)
+            with open(self.update_file_for(item_path), 'w') as f:
+                f.write(markdown)
+            self.record_update(item_path)
+        else:
+            with open(self.context_path, 'a') as f:
+                f.write(f"\n\n## Update from {item_path} review ({datetime.now():%Y-%m-%d %H:%M})\n"
+                        f"{markdown.strip()}\n")
+
+    def discard_update(self, item_path: str):
+        """Drop the update file of a failed call so it never reaches the scratchsheet"""
+        self.update_file_for(item_path).unlink(missing_ok=True)
+
+    def record_update(self, item_path: str) -> bool:
+        """Turn the agent's per-item update file into one append-only log record"""
+        update_file = self.update_file_for(item_path)
+        if not update_file.exists():
+            return False
+
+        with open(update_file, 'r') as f:
+            _, sections = self.parse(f.read())
+        record = {
+            'item': item_path,
+            'recorded_at': datetime.utcnow().isoformat() + 'Z',
+            'based_on_version': self.snapshot_version(),
+            'entries': [{'section': s.name, 'text': e} for s in sections for e in s.entries]
+        }
+
+        # A single short append per record keeps concurrent writers from interleaving
+        with open(self.log_path, 'a') as log:
+            log.write(json.dumps(record) + "\n")
+        update_file.unlink()
+        return True
+
+    @TRACER.traced("context.merge_updates")
+    def merge_updates(self, force: bool = False) -> int:
+        """Fold pending log records into a new scratchsheet snapshot; returns records merged"""
+        try:
+            lock_fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            # Another worker is merging; break the lock only if its owner is long gone
+            try:
+                if time.time() - self.lock_path.stat().st_mtime < 600:
+                    return 0
+                self.lock_path.unlink()
+            except FileNotFoundError:
+                pass  # Released while we looked; try to take it again
+            return self.merge_updates(force)
+
+        try:
+            state = self._read_state()
+            offset = state.get('log_offset', 0)
+            if not self.log_path.exists():
+                return 0
+
+            with open(self.log_path, 'rb') as log:
+                log.seek(offset)
+                pending = log.read()
+            # Only merge complete lines; a record still being written waits for the next merge
+            complete = pending[:pending.rfind(b"\n") + 1]
+            records = [json.loads(line) for line in complete.decode('utf-8').splitlines() if line.strip()]
+            if not records or (not force and len(records) < self.merge_every):
+                return 0
+
+            additions = []
+            for record in records:
+                for entry in record.get('entries', []):
+                    additions.append(f"### {entry['section']}\n{self.render_entry(entry['text'])}")
+
+            with open(self.context_path, 'r') as f:
+                text = f.read()
+            self.compact(text + "\n\n" + "\n\n".join(additions))
+
+            self._write_state({
+                'version': state.get('version', 0) + 1,
+                'log_offset': offset + len(complete),
+                'merged_records': state.get('merged_records', 0) + len(records),
+                'merged_at': datetime.utcnow().isoformat() + 'Z'
+            })
+            return len(records)
+        finally:
+            os.close(lock_fd)
+            self.lock_path.unlink(missing_ok=True)
+
+    def _read_state(self) -> Dict[str, Any]:
+        """Read the snapshot version and log offset"""
+        if not self.state_path.exists():
+            return {}
+        with open(self.state_path, 'r') as f:
+            return json.load(f)
+
+    def _write_state(self, state: Dict[str, Any]):
+        """Atomically replace the snapshot state"""
+        tmp_path = self.state_path.with_name(self.state_path.name + ".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    @TRACER.traced("context.select")
+    def select(self, text: str, item: Dict[str, Any], item_file: Optional[ItemFile] = None) -> str:
+        """Return the sections relevant to an item, trimmed to the token budget when one is set
+
+        BM25 retrieval always narrows to top_k entries; section ranking only applies under a budget.
+        """
+        if not self.max_tokens and self.retrieval != 'bm25':
+            return text
+
+        if self.retrieval == 'bm25':
+            sections, ranked = self._rank_by_index(text, item, item_file)
+        else:
+            sections, ranked = self._rank_by_sections(text, item)
+
+        chosen = set()
+        budget = self.max_tokens
+        for section_index, entry_index in ranked:
+            entry = sections[section_index].entries[entry_index]
+            if self.max_tokens:
+                cost = estimate_tokens(entry) + 1
+                if cost > budget:
+                    continue
+                budget -= cost
+            chosen.add((section_index, entry_index))
+
+        lines = []
+        for section_index, section in enumerate(sections):
+            entries = [e for i, e in enumerate(section.entries) if (section_index, i) in chosen]
+            if entries:
+                lines.append(f"### {section.name}")
+                lines.extend(self.render_entry(entry) for entry in entries)
+                lines.append("")
+
+        return "\n".join(lines).rstrip() or "No relevant global context yet."
+
+    def _rank_by_sections(self, text: str, item: Dict[str, Any]) -> Tuple[List[ContextSection], List[Tuple[int, int]]]:
+        """Entries tagged for the item's language or naming its directories first, then untagged ones
+
+        Only entries explicitly tagged for other languages are dropped.
+        """
+        _, sections = self.parse(text)
+        item_languages, directory_terms = self._relevance_terms(item)
+
+        candidates = []
+        for section_index, section in enumerate(sections):
+            for entry_index, entry in enumerate(section.entries):
+                languages = self._entry_languages(entry)
+                if languages and not languages & item_languages:
+                    continue
+                tokens = set(re.findall(r'[a-z0-9_+#]+', entry.lower()))
+                relevance = 2 if languages or tokens & directory_terms else 1
+                candidates.append((-relevance, section_index, entry_index))
+
+        return sections, [(section_index, entry_index) for _, section_index, entry_index in sorted(candidates)]
+
+    def _rank_by_index(self, text: str, item: Dict[str, Any],
+                       item_file: Optional[ItemFile] = None) -> Tuple[List[ContextSection], List[Tuple[int, int]]]:
+        """Top-k entries by BM25 against the item's path, language and a content sketch"""
+        key = hash(text)
+        if self._index_cache is None or self._index_cache[0] != key:
+            _, sections = self.parse(text)
+            documents = [f"{section.name} {entry}" for section in sections for entry in section.entries]
+            self._index_cache = (key, sections, ContextIndex(documents))
+        _, sections, index = self._index_cache
+
+        positions = [(s, e) for s, section in enumerate(sections) for e in range(len(section.entries))]
+        query = ContextIndex.tokenize(item['path'].replace('/', ' ').replace('.', ' '))
+        extension = Path(item['path']).suffix[1:].lower()
+        query += self.LANGUAGE_ALIASES.get(extension, [])
+        if item.get('language'):
+            query.append(str(item['language']).lower())
+        query += self._content_sketch(item, item_file)
+
+        # Ties (including unmatched entries) fall back to the most recent
+        scores = index.scores(query)
+        order = sorted(range(len(positions)), key=lambda i: (-scores[i], -i))
+        return sections, [positions[i] for i in order[:self.top_k]]
+
+    @staticmethod
+    def _content_sketch(item: Dict[str, Any], item_file: Optional[ItemFile] = None,
+                        max_bytes: int = 4096, max_terms: int = 40) -> List[str]:
+        """Most frequent identifier tokens from the head of the item"""
+        try:
+            if item_file is not None:
+                head = item_file.head(max_bytes)
+            else:
+                with ItemFile(item['path']) as f:
+                    head = f.head(max_bytes)
+        except OSError:
+            return []
+
+        counts: Dict[str, int] = {}
+        for token in ContextIndex.tokenize(head):
+            if not token.isdigit():
+                counts[token] = counts.get(token, 0) + 1
+        return sorted(counts, key=counts.get, reverse=True)[:max_terms]
+
+    def _relevance_terms(self, item: Dict[str, Any]) -> Tuple[set, set]:
+        """Extensions the item's language goes by, and its directory names"""
+        extension = Path(item['path']).suffix[1:].lower()
+        names = set(self.LANGUAGE_ALIASES.get(extension, []))
+        languages = {extension} | {ext for ext, aliases in self.LANGUAGE_ALIASES.items() if names & set(aliases)}
+        directory_terms = {part.lower() for part in Path(item['path']).parent.parts if len(part) > 2}
+        return languages, directory_terms
+
+    def _entry_languages(self, entry: str) -> set:
+        """Extensions an entry is explicitly tagged for, by [language] tags or extension tokens"""
+        languages = set()
+        for tag, extension in self.LANGUAGE_TAG.findall(entry.lower()):
+            if extension:
+                # Only known extensions, so dotfiles and directories such as .github stay untagged
+                if extension in self.LANGUAGE_ALIASES:
+                    languages.add(extension)
+            else:
+                languages.update(ext for ext, aliases in self.LANGUAGE_ALIASES.items() if tag == ext or tag in aliases)
+        return languages
+
+
+@dataclass
+class ItemChunk:
+    """A contiguous line range of an oversized item"""
+    index: int
+    start_line: int
+    end_line: int
+    content: str
+
+
+class ItemChunker:
+    """Split oversized items along heading or top-level definition boundaries"""
+
+    DOCUMENT_SUFFIXES = {'.md', '.markdown', '.rst', '.txt', '.adoc'}
+
+    def __init__(self, max_tokens: int = 6000, overlap_lines: int = 20):
+        self.max_tokens = max_tokens
+        self.overlap_lines = overlap_lines
+
+    def is_boundary(self, line: str, suffix: str) -> bool:
+        """Whether a new logical section starts at this line"""
+        if suffix in self.DOCUMENT_SUFFIXES:
+            return bool(re.match(r'^#{1,6}\s', line)) or bool(re.match(r'^[=-]{3,}\s*$', line))
+        # Unindented code that is not a closing bracket starts a top-level definition
+        return bool(line) and not line[0].isspace() and line.lstrip()[:1] not in ('}', ')', ']')
+
+    def split(self, text: str, path: str) -> List[ItemChunk]:
+        """Chunks of at most max_tokens each, with overlap carried over from the previous chunk"""
+        lines = text.splitlines()
+        suffix = Path(path).suffix.lower()
+        max_chars = self.max_tokens * 4
+
+        # Group lines into logical segments first
+        segments: List[Tuple[int, int]] = []
+        start = 0
+        for number, line in enumerate(lines):
+            if number > start and self.is_boundary(line, suffix):
+                segments.append((start, number))
+                start = number
+        segments.append((start, len(lines)))
+
+        # Segments larger than a chunk are cut on plain line counts
+        sized: List[Tuple[int, int]] = []
+        for seg_start, seg_end in segments:
+            size = 0
+            cut = seg_start
+            for number in range(seg_start, seg_end):
+                size += len(lines[number]) + 1
+                if size > max_chars and number > cut:
+                    sized.append((cut, number))
+                    cut, size = number, len(lines[number]) + 1
+            sized.append((cut, seg_end))
+
+        # Pack segments greedily into chunks
+        ranges: List[Tuple[int, int]] = []
+        chunk_start, chunk_size = sized[0][0], 0
+        for seg_start, seg_end in sized:
+            seg_size = sum(len(lines[n]) + 1 for n in range(seg_start, seg_end))
+            if chunk_size and chunk_size + seg_size > max_chars:
+                ranges.append((chunk_start, seg_start))
+                chunk_start, chunk_size = seg_start, 0
+            chunk_size += seg_size
+        ranges.append((chunk_start, sized[-1][1]))
+
+        chunks = []
+        for index, (chunk_start, chunk_end) in enumerate(ranges):
+            overlap_start = max(0, chunk_start - self.overlap_lines) if index else chunk_start
+            chunks.append(ItemChunk(
+                index=index,
+                start_line=overlap_start + 1,
+                end_line=chunk_end,
+                content="\n".join(lines[overlap_start:chunk_end])
+            ))
+        return chunks
+
+    @staticmethod
+    def merge_results(item: Dict[str, Any], documents: List[str]) -> str:
+        """Merge per-chunk <analysis> documents into one per-item document"""
+        import xml.etree.ElementTree as ET
+
+        merged = ET.Element('analysis')
+        metadata = ET.SubElement(merged, 'metadata')
+        for tag, value in (('source_file', item['path']), ('language', item.get('language', 'Unknown')),
+                           ('loc', item.get('loc', 0)), ('chunks', len(documents)),
+                           ('processed_at', datetime.utcnow().isoformat() + 'Z'), ('status', 'completed')):
+            ET.SubElement(metadata, tag).text = str(value)
+
+        scores = ET.SubElement(merged, 'scores')
+        summaries = []
+        sections: Dict[str, ET.Element] = {}
+        seen = set()
+
+        for document in documents:
+            root = ET.fromstring(document)
+            # A dimension scores no better than its weakest chunk
+            for score in root.findall('./scores/*'):
+                current = scores.find(score.tag)
+                try:
+                    value = int((score.text or '').strip())
+                except ValueError:
+                    continue
+                if current is None:
+                    ET.SubElement(scores, score.tag).text = str(value)
+                elif value < int(current.text):
+                    current.text = str(value)
+
+            if (root.findtext('./summary') or '').strip():
+                summaries.append(root.findtext('./summary').strip())
+
+            # Lists such as issues, findings and recommendations are concatenated without duplicates
+            for section in root:
+                if section.tag in ('metadata', 'scores', 'summary'):
+                    continue
+                target = sections.get(section.tag)
+                if target is None:
+                    target = sections[section.tag] = ET.SubElement(merged, section.tag)
+                    if not len(section):
+                        target.text = section.text
+                for child in section:
+                    key = (section.tag, ET.tostring(child))
+                    if key not in seen:
+                        seen.add(key)
+                        target.append(child)
+
+        ET.SubElement(merged, 'summary').text = "\n".join(summaries)
+        return ET.tostring(merged, encoding='unicode')
+
+
+class Item:
+    """Compact item record: slots instead of a per-item dict, shared status/language strings, integer mtime
+
+    Supports the mapping operations the framework uses on items, so loaded records and freshly
+    collected dicts are interchangeable. Unknown keys live in a small `extra` dict.
+    """
+
+    SLOT_FIELDS = ('path', 'absolute_path', 'size', 'status', 'language', 'loc', 'processed_at', 'context_version',
+                   'input_tokens', 'output_tokens', 'cache_read_tokens', 'cache_creation_tokens', 'cost_usd', 'blob')
+    INTERNED_FIELDS = ('status', 'language')
+    __slots__ = SLOT_FIELDS + ('mtime_us', 'extra', 'dirty')
+    _SLOTS = frozenset(SLOT_FIELDS)
+
+    def __init__(self):
+        self.extra = None
+        # Set by any change after loading; journaled saves write only dirty records
+        self.dirty = False
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Item':
+        """Build a record from a master.json item"""
+        item = cls()
+        slots = cls._SLOTS
+        for key, value in data.items():
+            if key in slots:
+                if key in cls.INTERNED_FIELDS and value.__class__ is str:
+                    value = sys.intern(value)
+                setattr(item, key, value)
+            else:
+                item[key] = value
+        # Collectors write the same string for both; share it
+        if data.get('absolute_path') == data.get('path'):
+            item.absolute_path = item.path
+        item.dirty = False
+        return item
+
+    @classmethod
+    def json_hook(cls, data: Dict[str, Any]) -> Any:
+        """json object_hook turning item objects into records as they are decoded"""
+        return cls.from_dict(data) if 'path' in data and 'size' in data else data
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The master.json form of the record"""
+        missing = Item._SLOTS
+        data = {name: value for name in self.SLOT_FIELDS[:3] if (value := getattr(self, name, missing)) is not missing}
+        if hasattr(self, 'mtime_us'):
+            data['modified'] = datetime.fromtimestamp(self.mtime_us / 1_000_000).isoformat()
+        for name in self.SLOT_FIELDS[3:]:
+            value = getattr(self, name, missing)
+            if value is not missing:
+                data[name] = value
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __getitem__(self, key: str) -> Any:
+        if key == 'modified' and hasattr(self, 'mtime_us'):
+            return datetime.fromtimestamp(self.mtime_us / 1_000_000).isoformat()
+        if key in self.SLOT_FIELDS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self.extra is None or key not in self.extra:
+            raise KeyError(key)
+        return self.extra[key]
+
+    def __setitem__(self, key: str, value: Any):
+        self.dirty = True
+        if key == 'modified':
+            try:
+                self.mtime_us = round(datetime.fromisoformat(value).timestamp() * 1_000_000)
+            except (TypeError, ValueError):
+                # Not a timestamp (e.g. None): no mtime, and the value is kept as given
+                if hasattr(self, 'mtime_us'):
+                    del self.mtime_us
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[key] = value
+            else:
+                if self.extra is not None:
+                    self.extra.pop(key, None)
+        elif key in self.SLOT_FIELDS:
+            if key in self.INTERNED_FIELDS and isinstance(value, str):
+                value = sys.intern(value)
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key: str) -> bool:
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def update(self, values: Dict[str, Any]):
+        for key, value in values.items():
+            self[key] = value
+
+    def pop_extra(self, key: str, default: Any = None) -> Any:
+        """Remove a key outside the fixed slots"""
+        if self.extra is None or key not in self.extra:
+            return default
+        self.dirty = True
+        return self.extra.pop(key)
+
+    def keys(self) -> List[str]:
+        return list(self.to_dict())
+
+
+class ColumnarExport:
+    """Column-oriented snapshot of the item store: Parquet when pyarrow is installed, else a compact binary file"""
+
+    MAGIC = b"MRCOL1\n"
+    INT_COLUMNS = ('size', 'mtime_us', 'loc', 'input_tokens', 'output_tokens', 'cache_read_tokens',
+                   'cache_creation_tokens')
+    DICT_COLUMNS = ('status', 'language')
+
+    @classmethod
+    def columns(cls, items: Iterable[Any]) -> Dict[str, List[Any]]:
+        """Pull the exported fields out of records or dicts"""
+        names = ('path',) + cls.INT_COLUMNS + cls.DICT_COLUMNS + ('cost_usd',)
+        columns: Dict[str, List[Any]] = {name: [] for name in names}
+        for item in items:
+            record = item if isinstance(item, Item) else Item.from_dict(item)
+            columns['path'].append(record.path)
+            for name in cls.INT_COLUMNS + cls.DICT_COLUMNS + ('cost_usd',):
+                value = getattr(record, name, None)
+                columns[name].append(value if not isinstance(value, str) or name in cls.DICT_COLUMNS else None)
+        return columns
+
+    @classmethod
+    def write(cls, items: Iterable[Any], path: Path, fmt: str = 'auto') -> str:
+        """Write the export and return the format used"""
+        try:
+            import pyarrow
+        except ImportError:
+            pyarrow = None
+        if fmt == 'auto':
+            fmt = 'parquet' if pyarrow else 'binary'
+        if fmt == 'parquet' and pyarrow is None:
+            raise ValueError("Parquet export requires the pyarrow package")
+
+        columns = cls.columns(items)
+        if fmt == 'parquet':
+            import pyarrow.parquet
+
+            table = pyarrow.table({
+                name: pyarrow.array(values).dictionary_encode() if name in cls.DICT_COLUMNS else pyarrow.array(values)
+                for name, values in columns.items()
+            })
+            pyarrow.parquet.write_table(table, path, compression='zstd')
+        elif fmt == 'binary':
+            cls._write_binary(columns, path)
+        else:
+            raise ValueError(f"Unsupported export format: {fmt}")
+        return fmt
+
+    @classmethod
+    def _write_binary(cls, columns: Dict[str, List[Any]], path: Path):
+        """Magic line, JSON header line, then one zlib-compressed little-endian array per column"""
+        import zlib
+        from array import array
+
+        blobs = []
+        header = {'rows': len(columns['path']), 'columns': []}
+
+        encoded = [value.encode('utf-8') for value in columns['path']]
+        offsets = array('q', [0])
+        for value in encoded:
+            offsets.append(offsets[-1] + len(value))
+        blobs.append(('path', 'utf8', None, offsets.tobytes() + b"".join(encoded)))
+        for name in cls.INT_COLUMNS:
+            # -1 marks a missing value
+            values = array('q', [-1 if v is None else int(v) for v in columns[name]])
+            blobs.append((name, 'int64', None, values.tobytes()))
+        for name in cls.DICT_COLUMNS:
+            # Code 0 marks a missing value
+            dictionary = sorted({str(v) for v in columns[name] if v is not None})
+            codes = {value: i + 1 for i, value in enumerate(dictionary)}
+            blobs.append((name, 'dict16', dictionary,
+                          array('H', [0 if v is None else codes[str(v)] for v in columns[name]]).tobytes()))
+        blobs.append(('cost_usd', 'float64', None,
+                      array('d', [float('nan') if v is None else float(v) for v in columns['cost_usd']]).tobytes()))
+
+        if sys.byteorder != 'little':
+            raise ValueError("Binary export is only written on little-endian hosts")
+
+        offset = 0
+        payload = []
+        for name, kind, dictionary, raw in blobs:
+            data = zlib.compress(raw, 6)
+            column = {'name': name, 'type': kind, 'offset': offset, 'length': len(data)}
+            if dictionary is not None:
+                column['dictionary'] = dictionary
+            header['columns'].append(column)
+            payload.append(data)
+            offset += len(data)
+
+        with open(path, 'wb') as f:
+            f.write(cls.MAGIC + json.dumps(header).encode('utf-8') + b"\n")
+            for data in payload:
+                f.write(data)
+
+    @classmethod
+    def read_binary(cls, path: Path) -> Dict[str, List[Any]]:
+        """Load a binary export back into lists per column"""
+        import zlib
+        from array import array
+
+        with open(path, 'rb') as f:
+            if f.readline() != cls.MAGIC:
+                raise ValueError(f"Not a columnar export: {path}")
+            header = json.loads(f.readline())
+            base = f.tell()
+            columns = {}
+            for column in header['columns']:
+                f.seek(base + column['offset'])
+                raw = zlib.decompress(f.read(column['length']))
+                if column['type'] == 'utf8':
+                    offsets = array('q')
+                    offsets.frombytes(raw[:8 * (header['rows'] + 1)])
+                    blob = raw[8 * (header['rows'] + 1):]
+                    columns[column['name']] = [blob[offsets[i]:offsets[i + 1]].decode('utf-8')
+                                               for i in range(header['rows'])]
+                elif column['type'] == 'dict16':
+                    codes = array('H')
+                    codes.frombytes(raw)
+                    dictionary = [None] + column['dictionary']
+                    columns[column['name']] = [dictionary[code] for code in codes]
+                else:
+                    values = array('q' if column['type'] == 'int64' else 'd')
+                    values.frombytes(raw)
+                    missing = (lambda v: v == -1) if column['type'] == 'int64' else (lambda v: v != v)
+                    columns[column['name']] = [None if missing(v) else v for v in values]
+        return columns
+
+
+class StoreSummary:
+    """Status counts, usage totals and recent throughput for master.json, kept in a small sidecar file"""
+
+    USAGE_FIELDS = ('input_tokens', 'output_tokens', 'cache_read_tokens', 'cache_creation_tokens', 'cost_usd')
+    RECENT_COMPLETIONS = 100
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.data = {
+            'total': 0,
+            'counts': {},
+            'usage': {name: 0 for name in self.USAGE_FIELDS},
+            'recent_completions': [],
+            'master_signature': None
+        }
+
+    @classmethod
+    def from_items(cls, path: Path, items: Dict[str, Dict[str, Any]]) -> 'StoreSummary':
+        """Full recount, used after populate or when the sidecar is stale"""
+        import heapq
+
+        summary = cls(path)
+        for item in items.values():
+            summary.add_item(item)
+
+        processed = heapq.nlargest(cls.RECENT_COMPLETIONS,
+                                   (item['processed_at'] for item in items.values() if item.get('processed_at')))
+        summary.data['recent_completions'] = sorted(
+            datetime.fromisoformat(stamp.rstrip('Z')).replace(tzinfo=timezone.utc).timestamp() for stamp in processed
+        )
+        return summary
+
+    def add_item(self, item: Dict[str, Any]):
+        """Count one item"""
+        counts = self.data['counts']
+        item_status = item.get('status', 'unknown')
+        counts[item_status] = counts.get(item_status, 0) + 1
+        for name in self.USAGE_FIELDS:
+            self.data['usage'][name] += item.get(name, 0)
+        self.data['total'] += 1
+
+    def load(self) -> bool:
+        """Read the sidecar; False if it is missing or unreadable"""
+        try:
+            with open(self.path, 'r') as f:
+                self.data = json.load(f)
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def matches(self, store: 'MasterStore') -> bool:
+        """Whether the sidecar was written together with the current master file and journal"""
+        try:
+            return self.data.get('master_signature') == store.signature()
+        except OSError:
+            return False
+
+    def apply(self, delta: Dict[str, Any]):
+        """Fold status transitions, usage changes and completion times into the totals"""
+        counts = self.data['counts']
+        for item_status, change in delta['counts'].items():
+            counts[item_status] = counts.get(item_status, 0) + change
+            if counts[item_status] <= 0:
+                del counts[item_status]
+        for name, change in delta['usage'].items():
+            self.data['usage'][name] = self.data['usage'].get(name, 0) + change
+        recent = self.data['recent_completions'] + delta['completions']
+        self.data['recent_completions'] = recent[-self.RECENT_COMPLETIONS:]
+
+    def save(self, store: 'MasterStore'):
+        """Atomically write the sidecar, stamped with the master file it describes"""
+        self.data['master_signature'] = store.signature()
+        temp_path = self.path.with_name(self.path.name + f".{os.getpid()}.tmp")
+        with open(temp_path, 'w') as f:
+            json.dump(self.data, f)
+        os.replace(temp_path, self.path)
+
+    @property
+    def pending(self) -> int:
+        """Items still to be mapped"""
+        return self.data['counts'].get('not_reviewed', 0) + self.data['counts'].get('in_progress', 0)
+
+    def throughput(self) -> Optional[float]:
+        """Items per second over the recent completion window"""
+        recent = self.data['recent_completions']
+        if len(recent) < 2 or recent[-1] <= recent[0]:
+            return None
+        return (len(recent) - 1) / (recent[-1] - recent[0])
+
+    def eta_seconds(self) -> Optional[float]:
+        """Time to finish the pending items at recent throughput"""
+        rate = self.throughput()
+        return self.pending / rate if rate else None
+
+
+class MasterStore:
+    """master.json with crash-safe rewrites and an optional append-only journal of changed items
+
+    Rewrites go to a temp file that is fsynced and renamed over master.json, so a crash leaves
+    either the old or the new copy. With journaling on, a save appends only the changed items as
+    one JSON line; loading replays the journal, and it is folded back into master.json every
+    `journal_compact_every` saves.
+    """
+
+    def __init__(self, master_file: Path, store_config: Dict[str, Any]):
+        self.path = master_file
+        self.journal_path = master_file.with_name(master_file.stem + ".journal.jsonl")
+        # None writes compact JSON through the C encoder; an int restores the old readable layout
+        self.indent = store_config.get('indent')
+        self.fsync = store_config.get('fsync', True)
+        self.journal = store_config.get('journal', False)
+        self.compact_every = store_config.get('journal_compact_every', 200)
+        self._journal_entries: Optional[int] = None
+        self._journal_torn_at: Optional[int] = None
+        # A resident process keeps the last loaded/saved data and reuses it until another process writes
+        self.keep_loaded = False
+        self._loaded: Optional[Dict[str, Any]] = None
+        self._loaded_signature: Optional[List[int]] = None
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def signature(self) -> List[int]:
+        """Identifies the on-disk state; raises OSError if master.json is missing"""
+        stat = self.path.stat()
+        try:
+            journal_size = self.journal_path.stat().st_size
+        except FileNotFoundError:
+            journal_size = 0
+        return [stat.st_mtime_ns, stat.st_size, journal_size]
+
+    def changed_externally(self) -> bool:
+        """Whether the files differ from what this process last loaded or saved"""
+        try:
+            return self._loaded is None or self.signature() != self._loaded_signature
+        except OSError:
+            return True
+
+    def _remember(self, data: Dict[str, Any]):
+        if self.keep_loaded:
+            self._loaded = data
+            self._loaded_signature = self.signature()
+
+    def load(self) -> Dict[str, Any]:
+        """Read master.json and replay any journaled changes"""
+        if self.keep_loaded and not self.changed_externally():
+            return self._loaded
+        if self.path.suffix != '.json':
+            raise ValueError(f"Unsupported master file format: {self.path.suffix}")
+        with open(self.path, 'r') as f:
+            data = json.load(f, object_hook=Item.json_hook)
+
+        entries = 0
+        self._journal_torn_at = None
+        if self.journal_path.exists():
+            with open(self.journal_path, 'rb') as f:
+                valid_bytes = 0
+                for line in f:
+                    try:
+                        entry = json_loads(line)
+                    except ValueError:
+                        # A torn final line from a crash mid-append; the save it belonged to never finished
+                        self._journal_torn_at = valid_bytes
+                        break
+                    valid_bytes += len(line)
+                    items = data.setdefault('items', {})
+                    for key, value in entry.get('items', {}).items():
+                        items[key] = Item.from_dict(value)
+                    for key in entry.get('removed', ()):
+                        items.pop(key, None)
+                    entries += 1
+        self._journal_entries = entries
+        self._remember(data)
+        return data
+
+    def save(self, data: Dict[str, Any], removed: Iterable[str] = ()):
+        """Journal the changed and removed items, or rewrite master.json when journaling is off or due for compaction"""
+        if not self.journal or not self.path.exists():
+            self.rewrite(data)
+            return
+
+        if self._journal_entries is None:
+            self._journal_entries = self._count_journal_entries()
+        if self._journal_entries >= self.compact_every:
+            self.rewrite(data)
+            return
+
+        changed = {}
+        for key, item in data.get('items', {}).items():
+            if getattr(item, 'dirty', True):
+                changed[key] = item
+        entry: Dict[str, Any] = {'items': changed}
+        removed = list(removed)
+        if removed:
+            entry['removed'] = removed
+        elif not changed:
+            return
+        line = json.dumps(entry, separators=(',', ':'), default=Item.to_dict) + "\n"
+        if self._journal_torn_at is not None:
+            os.truncate(self.journal_path, self._journal_torn_at)
+            self._journal_torn_at = None
+        with open(self.journal_path, 'a') as f:
+            f.write(line)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        for item in changed.values():
+            item.dirty = False
+        self._journal_entries += 1
+        self._remember(data)
+
+    def rewrite(self, data: Dict[str, Any]):
+        """Atomically replace master.json with the full data set and drop the journal"""
+        with self.atomic_writer() as f:
+            if self.indent is None:
+                f.write(json.dumps(data, separators=(',', ':'), default=Item.to_dict))
+            else:
+                json.dump(data, f, indent=self.indent, default=Item.to_dict)
+        for item in data.get('items', {}).values():
+            if isinstance(item, Item):
+                item.dirty = False
+        self._remember(data)
+
+    @contextmanager
+    def atomic_writer(self):
+        """Yield a temp file that replaces master.json (and clears the journal) only if the block succeeds"""
+        temp_path = self.path.with_name(self.path.name + f".{os.getpid()}.tmp")
+        self._loaded = None
+        try:
+            with open(temp_path, 'w') as f:
+                yield f
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+        # The new master.json already contains every journaled change
+        self.journal_path.unlink(missing_ok=True)
+        self._journal_entries = 0
+        if self.fsync and hasattr(os, 'O_DIRECTORY'):
+            # Make the rename itself durable
+            dir_fd = os.open(self.path.parent, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    def _count_journal_entries(self) -> int:
+        try:
+            with open(self.journal_path, 'rb') as f:
+                return sum(1 for _ in f)
+        except FileNotFoundError:
+            return 0
+
+
+class FileWatcher:
+    """Reports changed file paths under the watched roots: inotify on Linux, stat polling elsewhere
+
+    Paths are reported the way the filesystem collector builds them (os.walk root joined with the
+    name, normalized), so they match item keys in master.json. A path ending in os.sep is a
+    directory that went away with everything under it.
+    """
+
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ISDIR = 0x40000000
+    WATCH_MASK = IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+    EVENT_HEADER = "iIII"
+
+    def __init__(self, roots: List[str], exclude_directories: Iterable[str], poll_seconds: float = 2.0,
+                 use_inotify: bool = True):
+        import struct
+
+        self.roots = [root for root in roots if os.path.isdir(root)]
+        self.exclude = set(exclude_directories)
+        self.poll_seconds = poll_seconds
+        self._header = struct.Struct(self.EVENT_HEADER)
+        self._fd = self._open_inotify() if use_inotify else None
+        self._watches: Dict[int, str] = {}
+        # Set when the kernel queue overflowed and events were lost
+        self.overflowed = False
+        if self._fd is not None:
+            for root in self.roots:
+                self._watch_tree(root)
+            self.mode = "inotify"
+        else:
+            self._snapshot = self._scan()
+            self._last_scan = time.monotonic()
+            self.mode = "polling"
+
+    def _open_inotify(self) -> Optional[int]:
+        """An inotify descriptor via libc, or None where it is unavailable"""
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            import ctypes
+            import ctypes.util
+
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        self._libc = libc
+        return fd
+
+    def _watch_tree(self, root: str) -> List[str]:
+        """Watch a directory and its subdirectories; returns the files already in them"""
+        files = []
+        for directory, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if d not in self.exclude]
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), self.WATCH_MASK)
+            if wd >= 0:
+                self._watches[wd] = directory
+            files.extend(os.path.normpath(os.path.join(directory, name)) for name in filenames)
+        return files
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        """(mtime, size) of every file under the roots, for polling"""
+        snapshot = {}
+        for root in self.roots:
+            for directory, dirnames, filenames in os.walk(root):
+                dirnames[:] = [d for d in dirnames if d not in self.exclude]
+                for name in filenames:
+                    path = os.path.normpath(os.path.join(directory, name))
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def files(self) -> List[str]:
+        """Every file currently under the roots"""
+        return list(self._scan())
+
+    def changes(self, timeout: float, debounce: float = 1.0) -> set:
+        """Wait up to timeout for a change, then keep collecting until debounce seconds pass quietly"""
+        changed = set()
+        deadline = time.monotonic() + timeout
+        quiet_until = None
+        # A steady stream of writes must not postpone mapping forever
+        give_up = None
+        while True:
+            now = time.monotonic()
+            if quiet_until is not None:
+                if now >= quiet_until or now >= give_up:
+                    return changed
+                wait = min(quiet_until, give_up) - now
+            elif now >= deadline:
+                return changed
+            else:
+                wait = deadline - now
+
+            found = self._read_events(wait) if self._fd is not None else self._poll(wait)
+            if found:
+                changed |= found
+                quiet_until = time.monotonic() + debounce
+                give_up = give_up or time.monotonic() + max(debounce * 10, 10)
+
+    def _read_events(self, wait: float) -> set:
+        """Paths named by inotify events arriving within wait seconds"""
+        import select
+
+        readable, _, _ = select.select([self._fd], [], [], max(wait, 0))
+        if not readable:
+            return set()
+        try:
+            data = os.read(self._fd, 1 << 16)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self._header.unpack_from(data, offset)
+            offset += self._header.size
+            name = data[offset:offset + length].rstrip(b"\0").decode(errors="surrogateescape")
+            offset += length
+            if mask & self.IN_Q_OVERFLOW:
+                self.overflowed = True
+                continue
+            directory = self._watches.get(wd)
+            if mask & self.IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            if directory is None or not name:
+                continue
+            path = os.path.normpath(os.path.join(directory, name))
+            if mask & self.IN_ISDIR:
+                if name in self.exclude:
+                    continue
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    # Files can land in a new directory before its watch exists
+                    changed.update(self._watch_tree(path))
+                elif mask & (self.IN_MOVED_FROM | self.IN_DELETE):
+                    # A moved-away directory reports nothing for its contents
+                    changed.add(path + os.sep)
+                continue
+            changed.add(path)
+        return changed
+
+    def _poll(self, wait: float) -> set:
+        """Rescan at most every poll interval and diff against the last snapshot"""
+        due = self._last_scan + self.poll_seconds
+        time.sleep(max(0, min(wait, due - time.monotonic())))
+        if time.monotonic() < due:
+            return set()
+        self._last_scan = time.monotonic()
+        snapshot = self._scan()
+        changed = {path for path, signature in snapshot.items() if self._snapshot.get(path) != signature}
+        changed.update(path for path in self._snapshot if path not in snapshot)
+        self._snapshot = snapshot
+        return changed
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class LogStore:
+    """Compressed per-item transcript store with an offset index and size/age retention"""
+
+    SUFFIXES = {'zstd': '.log.zst', 'gzip': '.log.gz', 'none': '.log'}
+
+    def __init__(self, logs_dir: Path, logs_config: Dict[str, Any]):
+        import itertools
+        import threading
+
+        self.logs_dir = logs_dir
+        self.items_dir = logs_dir / "items"
+        self.live_dir = logs_dir / "live"
+        self.index_path = logs_dir / "index.jsonl"
+        self.lock_path = logs_dir / "index.lock"
+        self.max_total_bytes = int(logs_config.get('max_total_mb', 500) * 1024 * 1024)
+        self.max_age_seconds = logs_config.get('max_age_days', 30) * 86400
+        self.retention_every = logs_config.get('retention_every', 100)
+
+        try:
+            import zstandard
+        except ImportError:
+            zstandard = None
+        self.compression = logs_config.get('compression', 'auto')
+        if self.compression == 'auto':
+            self.compression = 'zstd' if zstandard else 'gzip'
+        if self.compression not in self.SUFFIXES:
+            raise ValueError(f"Unsupported log compression: {self.compression}")
+        if self.compression == 'zstd' and zstandard is None:
+            raise ValueError("Log compression 'zstd' requires the zstandard package")
+        self._zstd = zstandard
+
+        self._counter = itertools.count()
+        self._stored = 0
+        self._lock = threading.Lock()
+
+    def path_for(self, key: str) -> Path:
+        """Compressed log file for an item key, mirroring the item's path"""
+        parts = [part if part not in ('', '.', '..') else '_' for part in Path(key).parts if part != '/']
+        return self.items_dir.joinpath(*parts).with_name(parts[-1] + self.SUFFIXES[self.compression])
+
+    @contextmanager
+    def capture(self, keys: List[str], label: str = "map"):
+        """Yield a live log path for one engine call, then compress it into the first key's log
+
+        Every key is indexed to the stored run, so batch members find the shared transcript.
+        """
+        self.live_dir.mkdir(parents=True, exist_ok=True)
+        live_path = self.live_dir / f"{os.getpid()}-{next(self._counter)}-{time.time_ns()}.log"
+        try:
+            yield live_path
+        finally:
+            if live_path.exists():
+                self._store(live_path, keys, label)
+
+    def _store(self, live_path: Path, keys: List[str], label: str):
+        """Append the live log as one compressed member and index it"""
+        raw = live_path.read_bytes()
+        data = self._compress(raw)
+        target = self.path_for(keys[0])
+
+        with self._lock, self._index_lock():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with open(target, 'ab') as f:
+                offset = f.tell()
+                f.write(data)
+            stored = datetime.now().isoformat()
+            lines = "".join(json.dumps({
+                'key': key,
+                'file': str(target.relative_to(self.logs_dir)),
+                'offset': offset,
+                'length': len(data),
+                'raw_bytes': len(raw),
+                'label': label,
+                'time': stored
+            }) + "\n" for key in keys)
+            with open(self.index_path, 'a') as f:
+                f.write(lines)
+            self._stored += 1
+            run_retention = (self._stored - 1) % self.retention_every == 0
+
+        live_path.unlink()
+        if run_retention:
+            self.enforce_retention()
+
+    @contextmanager
+    def _index_lock(self):
+        """Hold the cross-process lock that serialises index appends, pruning and rewrites"""
+        self.logs_dir.mkdir(parents=True, exist_ok=True)
+        while True:
+            try:
+                os.close(os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                # Index writes take milliseconds, so a lock held this long belongs to a dead process
+                try:
+                    if time.time() - self.lock_path.stat().st_mtime > 60:
+                        self.lock_path.unlink()
+                        continue
+                except FileNotFoundError:
+                    continue
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            self.lock_path.unlink(missing_ok=True)
+
+    def _compress(self, raw: bytes) -> bytes:
+        """Compress one transcript as a self-contained gzip member or zstd frame"""
+        if self.compression == 'zstd':
+            return self._zstd.ZstdCompressor(level=6).compress(raw)
+        if self.compression == 'gzip':
+            import gzip
+            return gzip.compress(raw, compresslevel=6)
+        return raw
+
+    def _decompress(self, path: Path, data: bytes) -> bytes:
+        """Decompress one stored member, whatever compression it was written with"""
+        if path.suffix == '.zst':
+            if self._zstd is None:
+                raise ValueError(f"Reading {path} requires the zstandard package")
+            return self._zstd.ZstdDecompressor().decompress(data)
+        if path.suffix == '.gz':
+            import gzip
+            return gzip.decompress(data)
+        return data
+
+    def entries(self, key: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Index entries, oldest first, optionally for one key"""
+        if not self.index_path.exists():
+            return []
+
+        entries = []
+        with open(self.index_path, 'rb') as f:
+            for line in f:
+                try:
+                    entry = json_loads(line)
+                except ValueError:
+                    continue
+                if key is None or entry.get('key') == key:
+                    entries.append(entry)
+        return entries
+
+    def read(self, entry: Dict[str, Any]) -> str:
+        """Transcript text for one index entry"""
+        path = self.logs_dir / entry['file']
+        with open(path, 'rb') as f:
+            f.seek(entry['offset'])
+            data = f.read(entry['length'])
+        return self._decompress(path, data).decode('utf-8', errors='replace')
+
+    def search(self, pattern: str) -> List[Dict[str, Any]]:
+        """Index entries whose transcript matches a regular expression"""
+        regex = re.compile(pattern)
+        matches = []
+        seen = set()
+        for entry in self.entries():
+            run = (entry['file'], entry['offset'])
+            if run in seen:
+                continue
+            seen.add(run)
+            try:
+                if regex.search(self.read(entry)):
+                    matches.append(entry)
+            except (OSError, ValueError, EOFError):
+                continue
+        return matches
+
+    def enforce_retention(self) -> int:
+        """Delete item logs past max age, then oldest first until under the size cap"""
+        if not self.items_dir.exists():
+            return 0
+
+        # Other processes append to item logs and the index, so pruning runs under the index lock
+        with self._lock, self._index_lock():
+            return self._prune()
+
+    def _prune(self) -> int:
+        """Delete expired or excess item logs and drop their index entries"""
+        files = []
+        for root, _, names in os.walk(self.items_dir):
+            for name in names:
+                path = Path(root) / name
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+
+        cutoff = time.time() - self.max_age_seconds
+        total = sum(size for _, size, _ in files)
+        removed = set()
+        for mtime, size, path in files:
+            if mtime >= cutoff and total <= self.max_total_bytes:
+                break
+            path.unlink(missing_ok=True)
+            removed.add(str(path.relative_to(self.logs_dir)))
+            total -= size
+
+        if removed:
+            kept = [entry for entry in self.entries() if entry.get('file') not in removed]
+            temp_path = self.index_path.with_name(self.index_path.name + f".{os.getpid()}.tmp")
+            with open(temp_path, 'w') as f:
+                f.writelines(json.dumps(entry) + "\n" for entry in kept)
+            os.replace(temp_path, self.index_path)
+        return len(removed)
+
+
 class GenericMapReduce:
     """Main framework class for generic map-reduce processing"""
 
+    POPULATE_WRITE_BATCH = 1000
+
     def __init__(self, config_path: Path):
         self.config_path = config_path
         self.config = ConfigLoader.load_config(config_path)
         ConfigLoader.validate_config(self.config)
 
         self.framework_dir = Path(f"{self.config['project']['name']}-framework")
+        # Set from the CLI for the whole process, so config reloads leave it alone
+        self._metrics_textfile: Optional[Path] = None
+        self._init_runtime()
+
+    def _init_runtime(self):
+        """Set up directories, the processing engine and per-run caches"""
         self.data_dir = self.framework_dir / "data"
         self.results_dir = self.framework_dir / "results"
+        self.synthesis_dir = self.framework_dir / "synthesis"
         self.logs_dir = self.framework_dir / "logs"
-        engine_type = self.config.get('execution', {}).get('engine', 'claude')
+        execution_config = self.config.get('execution', {})
+        self.master_store = MasterStore(self.data_dir / "master.json", execution_config.get('store', {}))
+        engine_type = execution_config.get('engine', 'claude')
         if engine_type == 'claude':
             self.processing_engine = ClaudeProcessingEngine()
+        elif engine_type == 'http':
+            # A plain messages endpoint cannot edit files, so results must come back inline
+            if self.config['map'].get('output_mode', 'agent_file') != 'inline':
+                raise ValueError("The http engine requires map.output_mode 'inline'")
+            self.processing_engine = HttpProcessingEngine(execution_config.get('http', {}))
+        elif engine_type == 'mock':
+            self.processing_engine = MockProcessingEngine(execution_config.get('mock', {}))
         else:
             raise ValueError(f"Unsupported processing engine: {engine_type}")
-
+        self._prompt_plan: Optional[PromptPlan] = None
+        self._context_manager: Optional[GlobalContextManager] = None
+        self._log_store: Optional[LogStore] = None
+        self._engine_checked_at: Optional[float] = None
+        # Parsed result files by path, reused while their mtime and size are unchanged
+        self._result_cache: Dict[str, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+        self._summary_delta = self._new_summary_delta()
+        # Commit the items were collected from, when not the working tree; blobs are read through _git_objects
+        self._source_commit: Optional[str] = None
+        self._git_objects: Optional[GitObjects] = None
+        self._history_cache: Optional[Tuple[Tuple[str, Optional[str]], GitHistory]] = None
+        if execution_config.get('tracing', {}).get('enabled', False):
+            self.enable_tracing()
+
+    @TRACER.traced("store.load")
     def _load_master_data(self) -> Dict[str, Any]:
         """Load master data"""
-        master_file = self.data_dir / "master.json"
-        if not master_file.exists():
+        if not self.master_store.exists():
             return {}
 
-        with open(master_file, 'r') as f:
-            if master_file.suffix == '.json':
-                return json.load(f)
-            else:
-                raise ValueError(f"Unsupported master file format: {master_file.suffix}")
+        data = self.master_store.load()
+        self._source_commit = data.get('metadata', {}).get('source_commit')
+        return data
 
-    def _save_master_data(self, data: Dict[str, Any]):
-        """Save master data"""
-        master_file = self.data_dir / "master.json"
+    @TRACER.traced("store.save")
+    def _save_master_data(self, data: Dict[str, Any], removed: Iterable[str] = ()):
+        """Save master data and bring the status summary up to date"""
+        summary = StoreSummary(self.data_dir / "summary.json")
+        incremental = summary.load() and summary.matches(self.master_store)
 
-        with open(master_file, 'w') as f:
-            if master_file.suffix == '.json':
-                json.dump(data, f, indent=2)
-            else:
-                raise ValueError(f"Unsupported master file format: {master_file.suffix}")
+        self.master_store.save(data, removed)
+
+        if incremental:
+            summary.apply(self._summary_delta)
+        else:
+            summary = StoreSummary.from_items(summary.path, data.get('items', {}))
+        summary.data['total'] = len(data.get('items', {}))
+        summary.save(self.master_store)
+        self._summary_delta = self._new_summary_delta()
+
+    @staticmethod
+    def _new_summary_delta() -> Dict[str, Any]:
+        """Changes made since the last save"""
+        return {'counts': {}, 'usage': {}, 'completions': []}
+
+    def _set_status(self, item: Dict[str, Any], new_status: str):
+        """Change an item's status, recording the transition for the summary"""
+        old_status = item.get('status', 'unknown')
+        if old_status != new_status:
+            counts = self._summary_delta['counts']
+            counts[old_status] = counts.get(old_status, 0) - 1
+            counts[new_status] = counts.get(new_status, 0) + 1
+        item['status'] = new_status
+
+    def _load_store_summary(self) -> Optional[StoreSummary]:
+        """Current status summary, recounting master.json only if the sidecar is stale"""
+        if not self.master_store.exists():
+            return None
+
+        summary = StoreSummary(self.data_dir / "summary.json")
+        if summary.load() and summary.matches(self.master_store):
+            return summary
 
-    def populate(self, target_directories: Optional[List[str]] = None) -> int:
-        """Stage 1: Populate - collect items for processing"""
+        master_data = self._load_master_data()
+        summary = StoreSummary.from_items(summary.path, master_data.get('items', {}))
+        summary.save(self.master_store)
+        return summary
+
+    @TRACER.traced("populate")
+    def populate(self, target_directories: Optional[List[str]] = None, ref: Optional[str] = None) -> int:
+        """Stage 1: Populate - collect items for processing (from a commit instead of the worktree when ref is given)"""
         for directory in [self.framework_dir, self.data_dir, self.results_dir, self.logs_dir]:
             directory.mkdir(parents=True, exist_ok=True)
 
@@ -276,110 +3141,224 @@ class GenericMapReduce:
 
         populate_config = self.config['populate']
         strategy = populate_config['collection_strategy']
+        # Results of unchanged items are carried over, so read the previous store before it is replaced
+        previous = self._load_master_data().get('items', {}) if populate_config.get('incremental', False) else {}
+
+        ref = ref or populate_config.get('git', {}).get('ref')
+        if ref and strategy != 'git':
+            raise ValueError("Populating from a ref requires the git collection strategy")
+        self._source_commit = self._resolve_commit(ref) if ref else None
+        if self._source_commit and self.config['map'].get('output_mode', 'agent_file') != 'inline':
+            status(Y, f"Items come from {ref}, but in agent_file mode the engine reads the working tree; "
+                      "use map.output_mode 'inline' to review the commit's content")
+
         if strategy == 'filesystem':
             items = self._collect_filesystem_items(target_directories)
+        elif strategy == 'git' and self._source_commit:
+            items = self._collect_git_ref_items(self._source_commit, target_directories)
         elif strategy == 'git':
             items = self._collect_git_items(target_directories)
         else:
             raise ValueError(f"Unsupported collection strategy: {strategy}")
 
-        filtered_items = self._apply_filters(items, populate_config['item_filters'])
-        items_with_metadata = self._extract_metadata(filtered_items, populate_config['metadata_extraction'])
-        master_data = {
-            'metadata': {
-                'project': self.config['project'],
-                'generated': datetime.utcnow().isoformat() + 'Z',
-                'total_items': len(items_with_metadata),
-                'collection_strategy': strategy
-            },
-            'items': {}
+        # Each stage pulls one item at a time, so memory stays flat however many items there are
+        items = TRACER.timed_iter("populate.collect", items)
+        items = TRACER.timed_iter("populate.apply_filters", self._apply_filters(items, populate_config['item_filters']))
+        items = TRACER.timed_iter("populate.sniff_content", self._sniff_content(items))
+        items = TRACER.timed_iter("populate.extract_metadata",
+                                  self._extract_metadata(items, populate_config['metadata_extraction']))
+        if previous:
+            items = self._reuse_results(items, previous)
+        metadata = {
+            'project': self.config['project'],
+            'generated': datetime.utcnow().isoformat() + 'Z',
+            'collection_strategy': strategy
         }
+        if self._source_commit:
+            metadata['source_commit'] = self._source_commit
+        total = self._write_master_stream(metadata, items)
 
-        for item in items_with_metadata:
-            master_data['items'][item['path']] = item
-
-        self._save_master_data(master_data)
-
-        status(G, f"✓ Populated {len(items_with_metadata)} items")
+        status(G, f"✓ Populated {total} items")
         return 0
 
-    def _collect_filesystem_items(self, target_directories: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    def _reuse_results(self, items: Iterable[Dict[str, Any]], previous: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Keep completed results for items whose content hash (blob id or a sha256 rule field) is unchanged"""
+        extraction_rules = self.config['populate']['metadata_extraction'].get('extraction_rules', {})
+        hash_fields = ['blob'] + [name for name, rule in extraction_rules.items() if rule == 'sha256(file_content)']
+        reused = 0
+        for item in items:
+            old = previous.get(item['path'])
+            if (old is not None and old.get('status') == 'completed' and item.get('status') != 'skipped'
+                    and any(item.get(name) and item.get(name) == old.get(name) for name in hash_fields)):
+                for name in ('status', 'processed_at', 'context_version') + StoreSummary.USAGE_FIELDS:
+                    if name in old:
+                        item[name] = old[name]
+                reused += 1
+            yield item
+        status(G, f"Kept results for {reused} unchanged items")
+
+    def _write_master_stream(self, metadata: Dict[str, Any], items: Iterator[Dict[str, Any]]) -> int:
+        """Stream items into a fresh master.json in batched writes, then swap it in"""
+        summary = StoreSummary(self.data_dir / "summary.json")
+        # Only paths are kept, to drop duplicates from overlapping target directories
+        seen = set()
+        buffer: List[str] = []
+
+        with self.master_store.atomic_writer() as f:
+            f.write('{"items": {')
+            for item in items:
+                if item['path'] in seen:
+                    continue
+                buffer.append(("\n" if not seen else ",\n") + json.dumps(item['path']) + ": " + json.dumps(item))
+                seen.add(item['path'])
+                summary.add_item(item)
+                if len(buffer) >= self.POPULATE_WRITE_BATCH:
+                    f.write("".join(buffer))
+                    buffer.clear()
+            f.write("".join(buffer))
+            metadata['total_items'] = len(seen)
+            f.write('\n}, "metadata": ' + json.dumps(metadata) + '}\n')
+
+        summary.save(self.master_store)
+        self._summary_delta = self._new_summary_delta()
+        return len(seen)
+
+    def _collect_filesystem_items(self, target_directories: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
         """Collect items from filesystem"""
-        items = []
+        from stat import S_ISREG
 
         search_paths = [Path(d) for d in target_directories] if target_directories else [Path('.')]
+        # Excluded directories are never descended into; Path.rglob would also remember every path it yields
+        exclude_directories = set(self.config['populate']['item_filters'].get('exclude_directories', []))
 
         for search_path in search_paths:
             if not search_path.exists():
                 status(Y, f"Warning: Directory not found: {search_path}")
                 continue
 
-            for item_path in search_path.rglob('*'):
-                if item_path.is_file():
-                    items.append({
-                        'path': str(item_path.relative_to('.')),
-                        'absolute_path': str(item_path),
-                        'size': item_path.stat().st_size,
-                        'modified': datetime.fromtimestamp(item_path.stat().st_mtime).isoformat()
-                    })
-
-        return items
-
-    def _collect_git_items(self, target_directories: Optional[List[str]] = None) -> List[Dict[str, Any]]:
-        """Collect items from git"""
-        items = []
-
-        try:
-            if target_directories:
-                for directory in target_directories:
-                    result = subprocess.run(
-                        ['git', 'ls-files', directory],
-                        capture_output=True,
-                        text=True,
-                        check=True
-                    )
-                    for line in result.stdout.strip().split('\n'):
-                        if line:
-                            item_path = Path(line)
-                            if item_path.exists():
-                                items.append({
-                                    'path': line,
-                                    'absolute_path': str(item_path.absolute()),
-                                    'size': item_path.stat().st_size,
-                                    'modified': datetime.fromtimestamp(item_path.stat().st_mtime).isoformat()
-                                })
-            else:
-                result = subprocess.run(
-                    ['git', 'ls-files'],
-                    capture_output=True,
-                    text=True,
-                    check=True
-                )
-                for line in result.stdout.strip().split('\n'):
-                    if line:
-                        item_path = Path(line)
-                        if item_path.exists():
-                            items.append({
-                                'path': line,
-                                'absolute_path': str(item_path.absolute()),
-                                'size': item_path.stat().st_size,
-                                'modified': datetime.fromtimestamp(item_path.stat().st_mtime).isoformat()
-                            })
-        except subprocess.CalledProcessError:
+            for root, dirnames, filenames in os.walk(search_path):
+                dirnames[:] = [d for d in dirnames if d not in exclude_directories]
+                for name in filenames:
+                    path = os.path.normpath(os.path.join(root, name))
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    if S_ISREG(stat.st_mode):
+                        yield self._filesystem_item(path, stat)
+
+    @staticmethod
+    def _filesystem_item(path: str, stat: os.stat_result) -> Dict[str, Any]:
+        """Item for a file as the filesystem collector builds it"""
+        return {
+            'path': path,
+            'absolute_path': path,
+            'size': stat.st_size,
+            'modified': datetime.fromtimestamp(stat.st_mtime).isoformat()
+        }
+
+    def _collect_git_items(self, target_directories: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+        """Collect tracked files from the index with sizes and blob ids from the object database
+
+        Only files git reports as modified are stat'ed and re-hashed, so `blob` is always the id
+        of the content on disk and doubles as a stable content hash. Items carry `blob` in place of
+        `modified`: there is no mtime to report without a stat per file, so watch and incremental
+        populate compare these items by blob and exports leave their mtime_us empty.
+        """
+        pathspec = ['--'] + list(target_directories) if target_directories else []
+        try:
+            listing = self._git_z(['ls-files', '-s', '-z'] + pathspec)
+            modified = set(self._git_z(['ls-files', '-m', '-z'] + pathspec))
+        except (OSError, subprocess.CalledProcessError):
             status(Y, "Git not available, falling back to filesystem strategy")
-            return self._collect_filesystem_items(target_directories)
+            yield from self._collect_filesystem_items(target_directories)
+            return
+
+        entries = {}
+        for record in listing:
+            meta, path = record.split('\t', 1)
+            mode, blob, stage = meta.split(' ')
+            # Regular files only: no symlinks or submodules, and one entry per conflicted path
+            if mode in ('100644', '100755') and path not in entries:
+                entries[path] = blob
+
+        changed = {}
+        for path in modified:
+            if path in entries:
+                try:
+                    changed[path] = os.stat(path).st_size
+                except OSError:
+                    del entries[path]  # Deleted from the worktree
+        entries.update(GitObjects.hash_files(list(changed)))
+        sizes = GitObjects.sizes(blob for path, blob in entries.items() if path not in changed)
+
+        root = os.getcwd()
+        for path, blob in entries.items():
+            size = changed.get(path, sizes.get(blob))
+            if size is None:
+                continue
+            yield {'path': path, 'absolute_path': os.path.join(root, path), 'size': size, 'blob': blob}
+
+    def _collect_git_ref_items(self, commit: str,
+                               target_directories: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+        """Collect the files of a commit from `git ls-tree`, without checking it out"""
+        pathspec = ['--'] + list(target_directories) if target_directories else []
+        root = os.getcwd()
+        for record in self._git_z(['ls-tree', '-r', '-z', '--long', commit] + pathspec):
+            meta, path = record.split('\t', 1)
+            mode, kind, blob, size = meta.split()
+            if kind == 'blob' and mode in ('100644', '100755'):
+                yield {'path': path, 'absolute_path': os.path.join(root, path), 'size': int(size), 'blob': blob}
 
-        return items
+    @staticmethod
+    def _git_z(args: List[str]) -> List[str]:
+        """NUL-separated output of a git command"""
+        output = subprocess.run(['git'] + args, capture_output=True, check=True).stdout
+        return [entry for entry in output.decode(errors='surrogateescape').split('\0') if entry]
 
-    def _apply_filters(self, items: List[Dict[str, Any]], filter_config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    def _resolve_commit(self, ref: str) -> str:
+        """Full commit id for a ref, so a review is pinned even if the ref moves"""
+        try:
+            return subprocess.run(['git', 'rev-parse', '--verify', '--quiet', f"{ref}^{{commit}}"],
+                                  capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            raise ValueError(f"Not a commit in this repository: {ref}") from None
+
+    def _git_history(self) -> Optional[GitHistory]:
+        """Git history for the history rules, re-read only when the commit it starts from moves"""
+        rev = self._source_commit or 'HEAD'
+        since = self.config['populate'].get('git', {}).get('history_since')
+        try:
+            commit = subprocess.run(['git', 'rev-parse', '--verify', '--quiet', rev],
+                                    capture_output=True, text=True, check=True).stdout.strip()
+            if self._history_cache is None or self._history_cache[0] != (commit, since):
+                self._history_cache = ((commit, since), GitHistory.read(commit, since))
+        except (OSError, subprocess.CalledProcessError):
+            status(Y, "Git history not available; git_log fields are left empty")
+            return None
+        return self._history_cache[1]
+
+    def _item_file(self, item: Dict[str, Any]) -> ItemFile:
+        """Reader for an item's content: the worktree file, or its blob when items come from a commit"""
+        if self._source_commit and item.get('blob'):
+            if self._git_objects is None:
+                self._git_objects = GitObjects()
+            return ItemFile(item['path'], self._git_objects, item['blob'])
+        return ItemFile(item['path'])
+
+    def _apply_filters(self, items: Iterable[Dict[str, Any]],
+                       filter_config: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
         """Apply filters to items"""
-        filtered_items = []
-
         include_patterns = filter_config.get('include_patterns', [])
         exclude_patterns = filter_config.get('exclude_patterns', [])
         exclude_directories = filter_config.get('exclude_directories', [])
         max_size = filter_config.get('max_size_bytes', float('inf'))
 
+        # With chunking, oversized items are split at map time instead of dropped
+        chunking = self.config['map'].get('chunking', {})
+        if chunking.get('enabled', False):
+            max_size = chunking.get('max_item_bytes', float('inf'))
+
         for item in items:
             path = Path(item['path'])
 
@@ -392,53 +3371,114 @@ class GenericMapReduce:
             if exclude_patterns and any(path.match(pattern) for pattern in exclude_patterns):
                 continue
 
-            filtered_items.append(item)
-
-        return filtered_items
-
-    def _extract_metadata(self, items: List[Dict[str, Any]], metadata_config: Dict[str, Any]) -> List[Dict[str, Any]]:
+            yield item
+
+    def _sniff_content(self, items: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Drop or tag binary, minified, generated and lock files, sniffing heads in a thread pool"""
+        content_filter = self.config['populate'].get('content_filter', {})
+        if not content_filter.get('enabled', False):
+            yield from items
+            return
+
+        from collections import Counter, deque
+        from concurrent.futures import ThreadPoolExecutor
+
+        sniffer = ContentSniffer(content_filter)
+
+        def classify(item: Dict[str, Any]) -> Optional[str]:
+            try:
+                with self._item_file(item) as item_file:
+                    return sniffer.classify(item_file)
+            except OSError:
+                return None
+
+        # A bounded window of futures keeps order and memory flat; Executor.map would queue every item up front
+        window = deque()
+        flagged = Counter()
+
+        def drain(keep: int) -> Iterator[Dict[str, Any]]:
+            while len(window) > keep:
+                item, future = window.popleft()
+                reason = future.result()
+                if reason is not None:
+                    flagged[reason] += 1
+                    if sniffer.action == 'drop':
+                        continue
+                    item['skip_reason'] = reason
+                yield item
+
+        with ThreadPoolExecutor(max_workers=sniffer.workers) as pool:
+            for item in items:
+                window.append((item, pool.submit(classify, item)))
+                yield from drain(sniffer.workers * 4)
+            yield from drain(0)
+
+        if flagged:
+            verb = "Dropped" if sniffer.action == 'drop' else "Skipped"
+            status(Y, f"{verb} {sum(flagged.values())} items by content: "
+                      + ", ".join(f"{count} {reason}" for reason, count in sorted(flagged.items())))
+
+    # Content rules, all answered from one ItemFile per item
+    CONTENT_RULES = {
+        'count_lines(file_content)': ItemFile.line_count,
+        'sha256(file_content)': ItemFile.sha256,
+        'detect_encoding(file_content)': ItemFile.encoding,
+        'sniff_language(file_content)': ItemFile.language,
+        'complexity(file_content)': ItemFile.complexity,
+    }
+    # History rules, all answered from one git log pass per populate
+    HISTORY_RULES = {
+        'git_log.author': GitHistory.author,
+        'git_log.last_commit': GitHistory.last_commit,
+        'git_log.churn': GitHistory.churn,
+    }
+
+    def _extract_metadata(self, items: Iterable[Dict[str, Any]],
+                          metadata_config: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
         """Extract metadata from items"""
         extraction_rules = metadata_config.get('extraction_rules', {})
         required_fields = metadata_config.get('required_fields', [])
-
-        items_with_metadata = []
+        history = self._git_history() if any(rule in self.HISTORY_RULES for rule in extraction_rules.values()) else None
 
         for item in items:
-            # Start with basic item data
-            enhanced_item = item.copy()
-
-            # Apply extraction rules
-            for field, rule in extraction_rules.items():
+            # Items come fresh from the collector, so they are enriched in place
+            item_file = self._item_file(item)
+            for field_name, rule in extraction_rules.items():
                 try:
                     if rule == 'file_extension.title()':
-                        enhanced_item[field] = Path(item['path']).suffix[1:].title()
-                    elif rule == 'count_lines(file_content)':
-                        with open(item['path'], 'r', encoding='utf-8', errors='ignore') as f:
-                            enhanced_item[field] = sum(1 for _ in f)
+                        item[field_name] = Path(item['path']).suffix[1:].title()
+                    elif rule in self.CONTENT_RULES:
+                        item[field_name] = self.CONTENT_RULES[rule](item_file)
+                    elif rule in self.HISTORY_RULES:
+                        item[field_name] = self.HISTORY_RULES[rule](history, item['path']) if history else None
                     elif rule.startswith("'") and rule.endswith("'"):
-                        enhanced_item[field] = rule[1:-1]  # String literal
+                        item[field_name] = rule[1:-1]  # String literal
                     else:
-                        enhanced_item[field] = rule  # Direct value
+                        item[field_name] = rule  # Direct value
                 except Exception:
-                    enhanced_item[field] = None
+                    item[field_name] = None
+            item_file.close()
 
-            # Ensure required fields are present
-            for field in required_fields:
-                if field not in enhanced_item:
-                    enhanced_item[field] = None
+            # Content-sniffed items stay on record but are never picked up by map
+            if item.get('skip_reason'):
+                item['status'] = 'skipped'
 
-            items_with_metadata.append(enhanced_item)
+            # Ensure required fields are present
+            for field_name in required_fields:
+                if field_name not in item:
+                    item[field_name] = None
 
-        return items_with_metadata
+            yield item
 
-    def map_process(self) -> int:
-        """Stage 2: Map - process individual items"""
+    @TRACER.traced("map_process")
+    def map_process(self, item_key: Optional[str] = None, check_engine: bool = True) -> int:
+        """Stage 2: Map - process individual items (the next pending one unless item_key is given)"""
         if not self.framework_dir.exists():
             status(R, "Framework not initialized. Run populate first.")
             return 1
 
         # Check processing engine availability
-        if not self.processing_engine.check_availability():
+        if check_engine and not self._engine_available():
             status(R, "Error: Processing engine not available!")
             return 1
 
@@ -450,121 +3490,744 @@ class GenericMapReduce:
         # Find next item to process
         items = master_data.get('items', {})
         item_to_process = None
-        item_key = None
 
-        for key, item in items.items():
-            if item.get('status') in ['not_reviewed', 'in_progress']:
+        if item_key is not None:
+            item = items.get(item_key)
+            if item is not None and item.get('status') in ['not_reviewed', 'in_progress']:
                 item_to_process = item
-                item_key = key
-                break
+        else:
+            for key, item in items.items():
+                if item.get('status') in ['not_reviewed', 'in_progress']:
+                    item_to_process = item
+                    item_key = key
+                    break
 
         if not item_to_process:
             status(G, "All items processed!")
             return 0
 
+        # Pack further small items into the same prompt when batching is enabled
+        batch_keys = self._select_batch(items, item_key)
+        if len(batch_keys) > 1:
+            return self._map_batch(master_data, batch_keys)
+
+        # Split items too large for one prompt and map the chunks in parallel
+        chunker = self._get_chunker()
+        if chunker and item_to_process.get('size', 0) // 4 > chunker.max_tokens:
+            return self._map_chunked(master_data, item_key)
+
         status(B, f"=== Stage 2: Map - Processing {item_key} ===")
 
         # Mark item as in progress
-        master_data['items'][item_key]['status'] = 'in_progress'
+        self._set_status(master_data['items'][item_key], 'in_progress')
         self._save_master_data(master_data)
 
-        # Create output file for this item
-        output_file = self._create_output_file(item_to_process)
-
-        # Load global context if available
-        global_context = self._load_global_context()
-
-        # Get global context configuration
-        global_context_config = self.config['map'].get('global_context', {})
-
-        # Prepare template variables
-        template_vars = {
-            'item_path': item_to_process['path'],
-            'item_data': json.dumps(item_to_process, indent=2),
-            'output_file': str(output_file),
-            'global_context': global_context,
-            'context_file': global_context_config.get('context_file', ''),
-            'assessment_instructions': self._build_assessment_instructions(),
-            'output_requirements': self._build_output_requirements()
-        }
-
-        # Render processing template
-        processing_template = self.config['map']['processing_template']
-        prompt = TemplateEngine.render_template(processing_template, template_vars)
-
-        # Append instructions to update the global context
-        prompt += f"\n\n## Global Context Update Instructions\nAfter you have completed your review, update the global context file with your findings. {global_context_config.get('context_update_rules', '')}"
+        # Inline mode captures the result from the engine output instead of an agent-edited file
+        inline_output = self.config['map'].get('output_mode', 'agent_file') == 'inline'
+        if inline_output:
+            output_file = self._output_path(item_to_process)
+        else:
+            output_file = self._create_output_file(item_to_process)
+
+        # One read of the item serves context selection and the inline content
+        with self._item_file(item_to_process) as item_file:
+            # Load global context if available
+            global_context = self._load_global_context(item_to_process, item_file)
+
+            # Only per-item variables are rendered; static fragments come from the plan
+            template_vars = {
+                'item_path': item_to_process['path'],
+                'item_data': json.dumps(item_to_process, indent=2, default=Item.to_dict),
+                'output_file': "returned inline (see Response Format)" if inline_output else str(output_file),
+                'global_context': global_context
+            }
+            if inline_output:
+                template_vars['item_content'] = item_file.text()
+        context_manager = self._get_context_manager()
+        context_version = context_manager.snapshot_version() if context_manager else None
+        if context_manager and context_manager.update_mode == 'append_log' and not inline_output:
+            context_manager.updates_dir.mkdir(parents=True, exist_ok=True)
+            template_vars['context_update_file'] = str(context_manager.update_file_for(item_key))
+        prompt = self._get_prompt_plan().render(template_vars)
 
         # Run processing
-        self.logs_dir.mkdir(exist_ok=True)
-        log_file = self.logs_dir / f"map_{datetime.now():%Y%m%d_%H%M%S}.log"
-
-        result = self.processing_engine.process_item(prompt, log_file)
+        log_store = self._get_log_store()
+        with log_store.capture([item_key]) as log_file:
+            result = self._run_engine(prompt, log_file)
+
+        if result.success and inline_output:
+            error = self._write_inline_result(item_key, output_file, result.output_data or "")
+            if error:
+                result.success = False
+                result.error_message = error
+
+        if context_manager and context_manager.update_mode == 'append_log':
+            # One log record per successful item; whichever worker crosses the interval merges
+            if result.success:
+                context_manager.record_update(item_key)
+                context_manager.merge_updates()
+            else:
+                context_manager.discard_update(item_key)
 
         if result.success:
             # Mark item as completed
             master_data = self._load_master_data()
-            master_data['items'][item_key]['status'] = 'completed'
-            master_data['items'][item_key]['processed_at'] = datetime.utcnow().isoformat() + 'Z'
+            self._mark_completed(master_data['items'][item_key], result, context_version)
             self._save_master_data(master_data)
 
-            # Display summary
-            status(G, "✓ Processing completed!")
-            print(f"{B}=== Processing Summary ==={N}")
-            print(f"Item: {Y}{item_key}{N}")
-            print(f"Duration: {Y}{result.duration:.1f}s{N}")
-            if result.total_tokens > 0:
-                print(f"Tokens: {Y}{result.input_tokens:,}{N} in + {Y}{result.output_tokens:,}{N} out = {Y}{result.total_tokens:,}{N} total")
-                print(f"Cost: {Y}${result.cost_usd:.4f}{N}")
-
-            # Show progress
-            remaining = sum(1 for item in master_data['items'].values() if item.get('status') in ['not_reviewed', 'in_progress'])
-            completed = sum(1 for item in master_data['items'].values() if item.get('status') == 'completed')
-            total = len(master_data['items'])
-            print(f"Progress: {Y}{completed}/{total}{N} items ({Y}{remaining}{N} remaining)")
-
+            self._print_processing_summary(item_key, result)
             return 0
         else:
             status(R, f"✗ Processing failed! {result.error_message or 'Unknown error'}")
-            status(R, f"Check log: {log_file}")
+            status(R, f"Check log: {log_store.path_for(item_key)}")
+            return 1
+
+    def _mark_completed(self, item: Dict[str, Any], result: ProcessingResult, context_version: Optional[int],
+                        share: int = 1, position: int = 0):
+        """Record completion and this item's share of the call's usage
+
+        Items sharing one call (share > 1) are stamped evenly across the call's duration so throughput
+        reflects the call rather than one instant, and the last of them takes the token remainders.
+        """
+        now = time.time()
+        completed_at = now - result.duration * (share - 1 - position) / share
+        METRICS.inc('mapreduce_items_completed_total')
+        METRICS.set('mapreduce_last_completion_timestamp_seconds', now)
+        self._set_status(item, 'completed')
+        item['processed_at'] = datetime.utcfromtimestamp(completed_at).isoformat() + 'Z'
+        last = position == share - 1
+        usage = {
+            name: getattr(result, name) // share + (getattr(result, name) % share if last else 0)
+            for name in ('input_tokens', 'output_tokens', 'cache_read_tokens', 'cache_creation_tokens')
+        }
+        usage['cost_usd'] = result.cost_usd / share
+        # Re-mapped items replace their earlier usage in the totals
+        delta = self._summary_delta
+        for name, value in usage.items():
+            delta['usage'][name] = delta['usage'].get(name, 0) + value - item.get(name, 0)
+        delta['completions'].append(completed_at)
+        item['context_version'] = context_version
+        item.update(usage)
+
+    def _print_processing_summary(self, label: str, result: ProcessingResult):
+        """Display usage for one map call and overall progress"""
+        status(G, "✓ Processing completed!")
+        print(f"{B}=== Processing Summary ==={N}")
+        print(f"Item: {Y}{label}{N}")
+        print(f"Duration: {Y}{result.duration:.1f}s{N}")
+        if result.total_tokens > 0:
+            print(f"Tokens: {Y}{result.input_tokens:,}{N} in + {Y}{result.output_tokens:,}{N} out = {Y}{result.total_tokens:,}{N} total")
+            print(f"Cache: {Y}{result.cache_read_tokens:,}{N} read, {Y}{result.cache_creation_tokens:,}{N} created")
+            print(f"Cost: {Y}${result.cost_usd:.4f}{N}")
+
+        # Show progress
+        summary = self._load_store_summary()
+        completed = summary.data['counts'].get('completed', 0)
+        print(f"Progress: {Y}{completed}/{summary.data['total']}{N} items ({Y}{summary.pending}{N} remaining)")
+
+    def _select_batch(self, items: Dict[str, Any], first_key: str) -> List[str]:
+        """Pending small items to pack into one prompt, starting with first_key"""
+        batching = self.config['map'].get('batching', {})
+        if not batching.get('enabled', False):
+            return [first_key]
+
+        max_items = batching.get('max_items', 10)
+        max_item_tokens = batching.get('max_item_tokens', 1000)
+        budget = batching.get('max_batch_tokens', 8000)
+
+        def is_small(item: Dict[str, Any]) -> bool:
+            return not item.get('batch_excluded') and item.get('size', 0) // 4 <= max_item_tokens
+
+        if not is_small(items[first_key]):
+            return [first_key]
+
+        batch = []
+        for key, item in items.items():
+            if len(batch) >= max_items:
+                break
+            if item.get('status') not in ['not_reviewed', 'in_progress'] or not is_small(item):
+                continue
+            if key != first_key and not batch:
+                continue
+            cost = item.get('size', 0) // 4 + 1
+            if batch and cost > budget:
+                continue
+            budget -= cost
+            batch.append(key)
+
+        return batch
+
+    @TRACER.traced("map.batch")
+    def _map_batch(self, master_data: Dict[str, Any], batch_keys: List[str]) -> int:
+        """Map several small items with a single prompt and split the XML results per item"""
+        status(B, f"=== Stage 2: Map - Processing batch of {len(batch_keys)} items ===")
+
+        for key in batch_keys:
+            self._set_status(master_data['items'][key], 'in_progress')
+        self._save_master_data(master_data)
+
+        batch_items = []
+        for key in batch_keys:
+            item = master_data['items'][key]
+            with self._item_file(item) as item_file:
+                batch_items.append((item, item_file.text()))
+
+        first_key = batch_keys[0]
+        global_context = self._load_global_context(master_data['items'][first_key])
+        context_manager = self._get_context_manager()
+        context_version = context_manager.snapshot_version() if context_manager else None
+        context_update_file = None
+        if context_manager and context_manager.update_mode == 'append_log':
+            context_manager.updates_dir.mkdir(parents=True, exist_ok=True)
+            context_update_file = str(context_manager.update_file_for(first_key))
+
+        prompt = self._get_prompt_plan().render_batch(batch_items, global_context, context_update_file)
+
+        log_store = self._get_log_store()
+        with log_store.capture(batch_keys, label="batch") as log_file:
+            result = self._run_engine(prompt, log_file)
+
+        documents = self._split_batch_results(result.output_data or "") if result.success else {}
+        if context_manager and documents:
+            # Inline context updates for the whole batch follow the last <analysis> document
+            updates = re.search(r'<context_updates>(.*?)</context_updates>', result.output_data, flags=re.DOTALL)
+            if updates and updates.group(1).strip():
+                context_manager.apply_update(first_key, updates.group(1))
+
+        if context_manager and context_manager.update_mode == 'append_log':
+            # Only a call that produced results may contribute to the shared scratchsheet
+            if documents:
+                context_manager.record_update(first_key)
+                context_manager.merge_updates()
+            else:
+                context_manager.discard_update(first_key)
+
+        if not result.success:
+            status(R, f"✗ Processing failed! {result.error_message or 'Unknown error'}")
+            status(R, f"Check log: {log_store.path_for(first_key)}")
             return 1
 
-    def map_process_all(self, delay: int = 5) -> int:
+        master_data = self._load_master_data()
+        missing = []
+        delivered = [key for key in batch_keys if key in documents]
+        for key in batch_keys:
+            item = master_data['items'][key]
+            if key not in documents:
+                # Retry on its own next time rather than looping on the same batch
+                self._set_status(item, 'not_reviewed')
+                item['batch_excluded'] = True
+                missing.append(key)
+                continue
+            with open(self._output_path(item), 'w') as f:
+                f.write('<?xml version="1.0" encoding="UTF-8"?>\n' + documents[key])
+            position = delivered.index(key)
+            self._mark_completed(item, result, context_version, share=len(delivered), position=position)
+        self._save_master_data(master_data)
+
+        if missing:
+            status(Y, f"Warning: no result returned for {len(missing)} items, they will be retried individually")
+        self._print_processing_summary(f"{len(batch_keys) - len(missing)} of {len(batch_keys)} batched items", result)
+        return 0
+
+    @TRACER.traced("map.write_result")
+    def _write_inline_result(self, item_key: str, output_file: Path, text: str) -> Optional[str]:
+        """Extract, validate and write a result returned inline; returns an error message on failure"""
+        import xml.etree.ElementTree as ET
+
+        match = re.search(r'<analysis\b.*?</analysis>', text, flags=re.DOTALL)
+        if not match:
+            return "No <analysis> document in engine output"
+        try:
+            root = ET.fromstring(match.group(0))
+        except ET.ParseError as e:
+            return f"Malformed XML result: {e}"
+
+        expected = self.config['map'].get('output_schema', {}).get('properties', {})
+        missing = [name for name in expected if root.find(name) is None]
+        if missing:
+            status(Y, f"Warning: result for {item_key} is missing {', '.join(missing)}")
+
+        with open(output_file, 'w') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n' + match.group(0))
+
+        updates = re.search(r'<context_updates>(.*?)</context_updates>', text, flags=re.DOTALL)
+        context_manager = self._get_context_manager()
+        if updates and updates.group(1).strip() and context_manager:
+            context_manager.apply_update(item_key, updates.group(1))
+        return None
+
+    @staticmethod
+    def _split_batch_results(text: str) -> Dict[str, str]:
+        """Extract well-formed <analysis> documents keyed by their source_file"""
+        import xml.etree.ElementTree as ET
+
+        documents = {}
+        unnamed = []
+        for match in re.finditer(r'<analysis\b.*?</analysis>', text, flags=re.DOTALL):
+            try:
+                root = ET.fromstring(match.group(0))
+            except ET.ParseError:
+                continue
+            source_file = (root.findtext('.//source_file') or '').strip()
+            if source_file:
+                documents[source_file] = match.group(0)
+            else:
+                unnamed.append(match.group(0))
+        # A lone document without source_file can only belong to the single item asked about
+        if not documents and len(unnamed) == 1:
+            documents[''] = unnamed[0]
+        return documents
+
+    def _get_chunker(self) -> Optional[ItemChunker]:
+        """Chunker for oversized items, when chunking is enabled"""
+        chunking = self.config['map'].get('chunking', {})
+        if not chunking.get('enabled', False):
+            return None
+        return ItemChunker(chunking.get('max_chunk_tokens', 6000), chunking.get('overlap_lines', 20))
+
+    @TRACER.traced("map.chunked")
+    def _map_chunked(self, master_data: Dict[str, Any], item_key: str) -> int:
+        """Map an oversized item chunk by chunk and merge the results into one XML file"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        item = master_data['items'][item_key]
+        self._set_status(item, 'in_progress')
+        self._save_master_data(master_data)
+
+        with self._item_file(item) as item_file:
+            chunks = self._get_chunker().split(item_file.text(), item['path'])
+            global_context = self._load_global_context(item, item_file)
+        status(B, f"=== Stage 2: Map - Processing {item_key} in {len(chunks)} chunks ===")
+
+        context_manager = self._get_context_manager()
+        context_version = context_manager.snapshot_version() if context_manager else None
+        append_log = context_manager is not None and context_manager.update_mode == 'append_log'
+        if append_log:
+            context_manager.updates_dir.mkdir(parents=True, exist_ok=True)
+
+        plan = self._get_prompt_plan()
+        chunks_dir = self.framework_dir / "chunks" / Path(item_key).parent / Path(item_key).name
+        chunks_dir.mkdir(parents=True, exist_ok=True)
+        log_store = self._get_log_store()
+        parent_span = TRACER.current()
+
+        def map_chunk(chunk: ItemChunk) -> ProcessingResult:
+            update_key = f"{item_key}#chunk{chunk.index + 1}"
+            update_file = str(context_manager.update_file_for(update_key)) if append_log else None
+            prompt = plan.render_chunk(item, chunk, len(chunks), global_context, update_file)
+            with TRACER.attach(parent_span), \
+                    log_store.capture([item_key], label=f"chunk {chunk.index + 1}/{len(chunks)}") as log_file:
+                result = self._run_engine(prompt, log_file)
+            if append_log:
+                if result.success and self._split_batch_results(result.output_data or ""):
+                    context_manager.record_update(update_key)
+                else:
+                    context_manager.discard_update(update_key)
+            return result
+
+        max_parallel = self.config['map'].get('chunking', {}).get('max_parallel', 4)
+        with ThreadPoolExecutor(max_workers=max_parallel) as pool:
+            results = list(pool.map(map_chunk, chunks))
+
+        if append_log:
+            context_manager.merge_updates()
+
+        # Per-chunk results are kept outside results/ so reduce only sees the merged file
+        documents = []
+        for chunk, result in zip(chunks, results):
+            found = list(self._split_batch_results(result.output_data or "").values()) if result.success else []
+            if not found:
+                status(R, f"✗ Chunk {chunk.index + 1}/{len(chunks)} "
+                          f"(lines {chunk.start_line}-{chunk.end_line}) failed! "
+                          f"{result.error_message or 'No XML result returned'}")
+                status(R, f"Check log: {log_store.path_for(item_key)}")
+                return 1
+            with open(chunks_dir / f"chunk_{chunk.index + 1:03d}.xml", 'w') as f:
+                f.write(found[0])
+            documents.append(found[0])
+
+        with open(self._output_path(item), 'w') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n' + ItemChunker.merge_results(item, documents))
+
+        total = ProcessingResult(
+            success=True,
+            output_data=None,
+            output_lines=[],
+            input_tokens=sum(r.input_tokens for r in results),
+            output_tokens=sum(r.output_tokens for r in results),
+            total_tokens=sum(r.total_tokens for r in results),
+            cache_read_tokens=sum(r.cache_read_tokens for r in results),
+            cache_creation_tokens=sum(r.cache_creation_tokens for r in results),
+            cost_usd=sum(r.cost_usd for r in results),
+            duration=max(r.duration for r in results)
+        )
+
+        master_data = self._load_master_data()
+        self._mark_completed(master_data['items'][item_key], total, context_version)
+        master_data['items'][item_key]['chunks'] = len(chunks)
+        self._save_master_data(master_data)
+
+        self._print_processing_summary(f"{item_key} ({len(chunks)} chunks)", total)
+        return 0
+
+    def map_process_all(self, delay: int = 5, metrics_port: Optional[int] = None,
+                        metrics_textfile: Optional[str] = None) -> int:
         """Process all remaining items"""
         if not self.framework_dir.exists():
             return 1
 
+        self.start_metrics(metrics_port, metrics_textfile)
+        if not self._start_engine():
+            return 1
         processed = 0
         while True:
-            master_data = self._load_master_data()
-            if not master_data:
+            summary = self._load_store_summary()
+            if not summary:
                 break
 
-            remaining = sum(1 for item in master_data['items'].values() if item.get('status') in ['not_reviewed', 'in_progress'])
+            remaining = summary.pending
+            METRICS.set('mapreduce_items_remaining', remaining)
+            self._export_metrics()
             if remaining == 0:
                 break
 
             status(Y, f"Remaining: {remaining}, Starting #{processed + 1}")
-            if self.map_process() == 0:
-                processed += 11
+            step_start = time.time()
+            outcome = self.map_process()
+            METRICS.observe('mapreduce_map_item_seconds', time.time() - step_start)
+            if outcome == 0:
+                processed += 1
                 if remaining > 1:
                     time.sleep(delay)
             else:
+                METRICS.inc('mapreduce_map_failures_total')
+                self._export_metrics()
                 status(R, "Failed! Stopping.")
                 return 1
 
+        # Fold in whatever is left below the merge interval
+        context_manager = self._get_context_manager()
+        if context_manager and context_manager.update_mode == 'append_log':
+            context_manager.merge_updates(force=True)
+
         status(G, f"✓ Processed {processed} items")
         return 0
 
-    def _create_output_file(self, item: Dict[str, Any]) -> Path:
-        """Create output file for processed item"""
-        # Create output directory structure that mirrors the source
+    def serve(self, poll_seconds: Optional[float] = None, metrics_port: Optional[int] = None,
+              metrics_textfile: Optional[str] = None, watcher: Optional[FileWatcher] = None,
+              debounce: float = 1.0, reduce_every: Optional[float] = None,
+              reduce_severity: str = "medium", reduce_category: str = "all") -> int:
+        """Stay resident and map pending items as they appear, picking up new populates and config edits
+
+        With a watcher, changed files are applied to the store and queued as they settle, and
+        reduce re-runs every reduce_every seconds while there are new results.
+        """
+        import signal
+        from collections import deque
+
+        if not self.framework_dir.exists():
+            status(R, "Framework not initialized. Run populate first.")
+            return 1
+
+        serve_config = self.config.get('execution', {}).get('serve', {})
+        if poll_seconds is None:
+            poll_seconds = serve_config.get('poll_seconds', 5)
+
+        # SIGTERM finishes the current item first; Ctrl-C stops at once as in map-all
+        stop_signals = []
+        previous_handler = signal.signal(signal.SIGTERM, lambda signum, frame: stop_signals.append(signum))
+
+        self.start_metrics(metrics_port, metrics_textfile)
+        self.master_store.keep_loaded = True
+        config_mtime = self._config_mtime()
+        engine_ok = self._start_engine()
+        if not engine_ok:
+            status(R, "Processing engine not available; retrying every poll")
+        queue: deque = deque()
+        processed = failed = 0
+        last_reduce = time.monotonic()
+        results_changed = False
+        rebuild_queue = True
+        status(B, f"=== Serving {self.config['project']['name']}: polling every {poll_seconds}s (Ctrl-C to stop) ===")
+
+        try:
+            while not stop_signals:
+                mtime = self._config_mtime()
+                if mtime != config_mtime:
+                    config_mtime = mtime
+                    if self._reload_config():
+                        status(G, f"✓ Reloaded {self.config_path}")
+                        self.master_store.keep_loaded = True
+                        engine_ok = self._engine_available()
+
+                # New populates (or other writers) replace the queue; our own saves leave it alone
+                if self.master_store.exists() and (rebuild_queue or self.master_store.changed_externally()):
+                    rebuild_queue = False
+                    items = self._load_master_data().get('items', {})
+                    queue = deque(key for key, item in items.items()
+                                  if item.get('status') in ['not_reviewed', 'in_progress'])
+                    status(B, f"Queued {len(queue)} pending items")
+
+                if watcher is not None:
+                    # Only block on the filesystem when there is nothing to map
+                    changed = watcher.changes(0 if queue and engine_ok else poll_seconds, debounce)
+                    if watcher.overflowed:
+                        status(Y, "Change events were dropped; rescanning")
+                        watcher.overflowed = False
+                        changed |= set(watcher.files()) | set(self._load_master_data().get('items', {}))
+                    if changed:
+                        queued, removed = self._apply_file_changes(changed)
+                        queue.extend(queued)
+                        results_changed = results_changed or bool(removed)
+
+                if (reduce_every and results_changed and not queue
+                        and time.monotonic() - last_reduce >= reduce_every):
+                    self.reduce_synthesize(reduce_severity, reduce_category)
+                    last_reduce = time.monotonic()
+                    results_changed = False
+
+                METRICS.set('mapreduce_items_remaining', len(queue))
+                self._export_metrics()
+                if not engine_ok:
+                    if watcher is None:
+                        time.sleep(poll_seconds)
+                    engine_ok = self._engine_available()
+                    continue
+                if not queue:
+                    if watcher is None:
+                        time.sleep(poll_seconds)
+                    continue
+
+                item_key = queue.popleft()
+                item = self._load_master_data().get('items', {}).get(item_key)
+                if item is None or item.get('status') not in ['not_reviewed', 'in_progress']:
+                    # Already mapped as part of a batch, or dropped by a new populate
+                    continue
+
+                step_start = time.time()
+                outcome = self.map_process(item_key, check_engine=False)
+                METRICS.observe('mapreduce_map_item_seconds', time.time() - step_start)
+                if outcome == 0:
+                    processed += 1
+                    results_changed = True
+                else:
+                    # Left in progress; it is queued again after the next populate or config change
+                    failed += 1
+                    METRICS.inc('mapreduce_map_failures_total')
+        except KeyboardInterrupt:
+            pass
+        finally:
+            signal.signal(signal.SIGTERM, previous_handler)
+
+        context_manager = self._get_context_manager()
+        if context_manager and context_manager.update_mode == 'append_log':
+            context_manager.merge_updates(force=True)
+        self._export_metrics()
+
+        status(G, f"✓ Served {processed} items ({failed} failed)")
+        return 0
+
+    def watch(self, target_directories: Optional[List[str]] = None, debounce: Optional[float] = None,
+              reduce_every: Optional[float] = None, severity: str = "medium", category: str = "all",
+              poll_seconds: Optional[float] = None, metrics_port: Optional[int] = None,
+              metrics_textfile: Optional[str] = None) -> int:
+        """Keep results current: map files as they change under the populate targets"""
+        watch_config = self.config.get('execution', {}).get('watch', {})
+        debounce = debounce if debounce is not None else watch_config.get('debounce_seconds', 1.0)
+        if reduce_every is None:
+            reduce_every = watch_config.get('reduce_every_seconds')
+        if poll_seconds is None:
+            poll_seconds = watch_config.get('poll_seconds', 2.0)
+
+        if not self.master_store.exists():
+            status(Y, "No master data yet; populating first")
+            if self.populate(target_directories) != 0:
+                return 1
+
+        roots = target_directories or ['.']
+        # Framework output and git internals change on every save and commit
+        exclude = list(self.config['populate']['item_filters'].get('exclude_directories', []))
+        exclude += [self.framework_dir.name, '.git']
+        watcher = FileWatcher(roots, exclude, poll_seconds, use_inotify=not watch_config.get('polling', False))
+        status(B, f"Watching {', '.join(roots)} ({watcher.mode}, {debounce}s debounce)")
+
+        try:
+            # Catch up on edits made while nothing was watching; unchanged files are only stat'ed
+            catch_up = set(watcher.files()) | set(self._load_master_data().get('items', {}))
+            if self._source_commit:
+                status(R, f"Items were collected from commit {self._source_commit[:12]}; "
+                          "watch follows the working tree")
+                return 1
+            self.master_store.keep_loaded = True
+            self._apply_file_changes(catch_up)
+            return self.serve(poll_seconds, metrics_port, metrics_textfile, watcher=watcher, debounce=debounce,
+                              reduce_every=reduce_every, reduce_severity=severity, reduce_category=category)
+        finally:
+            watcher.close()
+
+    def _apply_file_changes(self, paths: Iterable[str]) -> Tuple[List[str], List[str]]:
+        """Bring master.json in line with changed files; returns (keys needing a map, removed keys)
+
+        Files go through the same item construction, item_filters and metadata extraction as
+        populate, and only those whose size or mtime differ from the stored item are re-read.
+        """
+        from stat import S_ISREG
+
+        master_data = self._load_master_data()
+        if not master_data:
+            return [], []
+        items = master_data.setdefault('items', {})
+        populate_config = self.config['populate']
+
+        paths = set(paths)
+        gone_dirs = tuple(path for path in paths if path.endswith(os.sep))
+        if gone_dirs:
+            paths.update(key for key in items if key.startswith(gone_dirs))
+
+        fresh = []
+        removed = []
+        for path in sorted(path for path in paths if not path.endswith(os.sep)):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stat = None
+            if stat is None or not S_ISREG(stat.st_mode):
+                if path in items:
+                    removed.append(path)
+                continue
+            new_item = self._filesystem_item(path, stat)
+            item = items.get(path)
+            # Items from the git index have no mtime to compare; their blob is checked below
+            if (item is not None and 'modified' in item and item.get('size') == new_item['size']
+                    and item['modified'] == new_item['modified']):
+                continue
+            fresh.append(new_item)
+
+        touched = False
+        if fresh and populate_config['collection_strategy'] == 'git':
+            tracked = self._git_tracked([item['path'] for item in fresh])
+            removed.extend(item['path'] for item in fresh if item['path'] not in tracked and item['path'] in items)
+            fresh = [item for item in fresh if item['path'] in tracked]
+
+            # A new mtime over the same blob (checkout, touch, editor save) needs no map
+            try:
+                blobs = GitObjects.hash_files([item['path'] for item in fresh])
+            except (OSError, subprocess.CalledProcessError):
+                blobs = {}
+            changed = []
+            for new_item in fresh:
+                new_item['blob'] = blobs.get(new_item['path'])
+                item = items.get(new_item['path'])
+                if item is not None and new_item['blob'] and item.get('blob') == new_item['blob']:
+                    if 'modified' in item:
+                        item['modified'] = new_item['modified']
+                        touched = True
+                    continue
+                # Keep the shape of items collected from the index: blob, no mtime
+                if new_item['blob']:
+                    del new_item['modified']
+                changed.append(new_item)
+            fresh = changed
+
+        accepted = {item['path']: item for item in self._extract_metadata(
+            self._sniff_content(self._apply_filters(fresh, populate_config['item_filters'])),
+            populate_config['metadata_extraction'])}
+        removed.extend(item['path'] for item in fresh if item['path'] not in accepted and item['path'] in items)
+
+        delta = self._summary_delta
+        queued = []
+        for path, new_item in accepted.items():
+            new_status = new_item.pop('status', None) or 'not_reviewed'
+            item = items.get(path)
+            if item is None:
+                item = Item.from_dict(new_item)
+                item['status'] = new_status
+                items[path] = item
+                delta['counts'][new_status] = delta['counts'].get(new_status, 0) + 1
+            else:
+                # A file that no longer sniffs as generated or binary loses its old reason
+                item.pop_extra('skip_reason')
+                item.update(new_item)
+                self._set_status(item, new_status)
+            if new_status != 'skipped':
+                queued.append(path)
+
+        for path in removed:
+            item = items.pop(path)
+            item_status = item.get('status', 'unknown')
+            delta['counts'][item_status] = delta['counts'].get(item_status, 0) - 1
+            for name in StoreSummary.USAGE_FIELDS:
+                delta['usage'][name] = delta['usage'].get(name, 0) - item.get(name, 0)
+            # Findings for a file that is gone must not reach the next reduce
+            (self.results_dir / Path(path).parent / f"{Path(path).stem}.xml").unlink(missing_ok=True)
+
+        if accepted or removed or touched:
+            self._save_master_data(master_data, removed=removed)
+            status(B, f"Changes: {len(queued)} to map, {len(removed)} removed")
+        return queued, removed
+
+    @staticmethod
+    def _git_tracked(paths: List[str]) -> set:
+        """The subset of paths git tracks, asked in a few batched ls-files calls"""
+        tracked = set()
+        for start in range(0, len(paths), 1000):
+            try:
+                output = subprocess.run(['git', 'ls-files', '-z', '--'] + paths[start:start + 1000],
+                                        capture_output=True, check=True).stdout
+            except (OSError, subprocess.CalledProcessError):
+                # Outside a repository the filesystem view is all there is
+                return set(paths)
+            listed = output.decode(errors='surrogateescape').split('\0')
+            tracked.update(os.path.normpath(path) for path in listed if path)
+        return tracked
+
+    def _config_mtime(self) -> Optional[int]:
+        try:
+            return self.config_path.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def _reload_config(self) -> bool:
+        """Swap in an edited config between items; an invalid edit keeps the running config"""
+        try:
+            config = ConfigLoader.load_config(self.config_path)
+            ConfigLoader.validate_config(config)
+        except (OSError, ValueError) as e:
+            status(R, f"Config reload failed, keeping the current config: {e}")
+            return False
+        if config['project']['name'] != self.config['project']['name']:
+            status(R, "Config reload skipped: project.name cannot change while serving")
+            return False
+
+        old_config, engine = self.config, self.processing_engine
+        self.config = config
+        try:
+            self._init_runtime()
+        except ValueError as e:
+            status(R, f"Config reload failed, keeping the current config: {e}")
+            self.config = old_config
+            self._init_runtime()
+            self.processing_engine = engine
+            return False
+
+        # Keep the engine, and with it any open connections, unless its settings changed
+        engine_keys = ('engine', 'http', 'mock')
+        if all(old_config.get('execution', {}).get(key) == config.get('execution', {}).get(key) for key in engine_keys):
+            self.processing_engine = engine
+        return True
+
+    def _output_path(self, item: Dict[str, Any]) -> Path:
+        """Result file for an item, mirroring the source directory structure"""
         item_path = Path(item['path'])
         output_dir = self.results_dir / item_path.parent
         output_dir.mkdir(parents=True, exist_ok=True)
 
-        # Create output file - always xml for map stage
-        output_file = output_dir / f"{item_path.stem}.xml"
+        # Always xml for map stage
+        return output_dir / f"{item_path.stem}.xml"
+
+    def _create_output_file(self, item: Dict[str, Any]) -> Path:
+        """Create output file for processed item"""
+        output_file = self._output_path(item)
 
         # Initialize output file with XML structure (always use XML for map stage)
         initial_content = f"""<?xml version="1.0" encoding="UTF-8"?>
@@ -593,24 +4256,300 @@ class GenericMapReduce:
 
         return output_file
 
-    def _load_global_context(self) -> str:
-        """Load global context for processing"""
-        map_config = self.config['map']
-        global_context_config = map_config.get('global_context', {})
-        context_file = global_context_config.get('context_file')
+    @TRACER.traced("context.load")
+    def _load_global_context(self, item: Optional[Dict[str, Any]] = None, item_file: Optional[ItemFile] = None) -> str:
+        """Load global context for processing, budgeted to the item when given"""
+        context_manager = self._get_context_manager()
 
-        if context_file:
-            context_path = self.framework_dir / context_file
+        if context_manager:
             # Create the context file and its directory if they don't exist
+            context_path = context_manager.context_path
             context_path.parent.mkdir(parents=True, exist_ok=True)
             if not context_path.exists():
                 self._initialize_global_context(context_path)
 
-            with open(context_path, 'r') as f:
-                return f.read()
+            text = context_manager.load()
+            return context_manager.select(text, item, item_file) if item else text
 
         return "No global context available."
 
+    def _get_context_manager(self) -> Optional[GlobalContextManager]:
+        """Create the global context manager once per run"""
+        if self._context_manager is None:
+            global_context_config = self.config['map'].get('global_context', {})
+            context_file = global_context_config.get('context_file')
+            if context_file:
+                self._context_manager = GlobalContextManager(self.framework_dir / context_file, global_context_config)
+
+        return self._context_manager
+
+    def _engine_available(self) -> bool:
+        """Check the processing engine, reusing a successful probe younger than the configured TTL
+
+        The probe is also remembered in data/engine_check.json, so a loop of map-next processes
+        does not spawn the CLI for every item.
+        """
+        ttl = self.config.get('execution', {}).get('engine_check', {}).get('ttl_seconds', 300)
+        now = time.time()
+        if self._engine_checked_at is not None and 0 <= now - self._engine_checked_at < ttl:
+            return True
+
+        check_file = self.data_dir / "engine_check.json"
+        fingerprint = self.processing_engine.fingerprint()
+        if ttl > 0:
+            try:
+                with open(check_file, 'r') as f:
+                    cached = json.load(f)
+                if cached.get('fingerprint') == fingerprint and 0 <= now - cached.get('checked_at', 0) < ttl:
+                    self._engine_checked_at = cached['checked_at']
+                    return True
+            except (OSError, ValueError):
+                pass
+
+        with TRACER.span("engine.check_availability"):
+            available = self.processing_engine.check_availability()
+        if available:
+            self._record_engine_check(fingerprint, now)
+        return available
+
+    def _record_engine_check(self, fingerprint: str, checked_at: float):
+        """Remember a successful probe for this process and later ones"""
+        self._engine_checked_at = checked_at
+        if not self.data_dir.exists():
+            return
+        check_file = self.data_dir / "engine_check.json"
+        tmp_path = check_file.with_name(check_file.name + f".{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({'fingerprint': fingerprint, 'checked_at': checked_at}, f)
+        os.replace(tmp_path, check_file)
+
+    def _forget_engine_check(self):
+        """Probe again before the next call, e.g. after a failed one"""
+        self._engine_checked_at = None
+        (self.data_dir / "engine_check.json").unlink(missing_ok=True)
+
+    def preflight(self, quiet: bool = False) -> int:
+        """Report engine version, authentication and capabilities; non-zero if the engine is unusable"""
+        with TRACER.span("engine.preflight"):
+            details = self.processing_engine.describe()
+        if details['available']:
+            self._record_engine_check(self.processing_engine.fingerprint(), time.time())
+        missing = [name for name, present in details['capabilities'].items() if not present]
+
+        if quiet:
+            if details['available']:
+                auth = details['auth'] or "credentials not detected"
+                version = f" {details['version']}" if details['version'] else ""
+                status(B, f"Engine: {details['engine']}{version} (auth: {auth})")
+            for name in missing:
+                status(Y, f"Warning: engine does not advertise {name}")
+        else:
+            print(f"{B}=== Engine Pre-flight ==={N}")
+            print(f"Engine: {Y}{details['engine']}{N}")
+            print(f"Available: {G + 'yes' if details['available'] else R + 'no'}{N}")
+            print(f"Version: {Y}{details['version'] or 'unknown'}{N}")
+            print(f"Auth: {Y}{details['auth'] or 'not detected (the engine may still find credentials itself)'}{N}")
+            for name, present in details['capabilities'].items():
+                print(f"  {G + '✓' if present else R + '✗'}{N} {name}")
+
+        if not details['available']:
+            status(R, "Error: Processing engine not available!")
+            return 1
+        return 0
+
+    def _start_engine(self) -> bool:
+        """Pre-flight and optional warm-up before a long run"""
+        engine_check = self.config.get('execution', {}).get('engine_check', {})
+        if engine_check.get('preflight', True):
+            if self.preflight(quiet=True) != 0:
+                return False
+        elif not self._engine_available():
+            return False
+
+        warm_up = engine_check.get('warm_up', False)
+        if warm_up:
+            with TRACER.span("engine.warm_up"):
+                self.processing_engine.warm_up(warm_up if not isinstance(warm_up, bool) else 1)
+        return True
+
+    def _run_engine(self, prompt: str, log_file: Path, synthesis: bool = False) -> ProcessingResult:
+        """Call the processing engine inside a span carrying latency and usage"""
+        name = "engine.synthesize_results" if synthesis else "engine.process_item"
+        with TRACER.span(name, engine=type(self.processing_engine).__name__,
+                         prompt_tokens_estimate=estimate_tokens(prompt)) as span:
+            METRICS.inc('mapreduce_active_engine_calls')
+            try:
+                if synthesis:
+                    result = self.processing_engine.synthesize_results(prompt, log_file)
+                else:
+                    result = self.processing_engine.process_item(prompt, log_file)
+            finally:
+                METRICS.inc('mapreduce_active_engine_calls', -1)
+            span.set(
+                success=result.success,
+                ttft_ms=result.time_to_first_token * 1000 if result.time_to_first_token is not None else None,
+                input_tokens=result.input_tokens,
+                output_tokens=result.output_tokens,
+                cache_read_tokens=result.cache_read_tokens,
+                cost_usd=result.cost_usd
+            )
+
+        if not result.success:
+            # A failure may mean the engine went away; the next call probes again
+            self._forget_engine_check()
+        kind = "reduce" if synthesis else "map"
+        METRICS.inc('mapreduce_engine_calls_total', kind=kind, outcome="success" if result.success else "failure")
+        METRICS.observe('mapreduce_engine_call_seconds', result.duration, kind=kind)
+        if result.time_to_first_token is not None:
+            METRICS.observe('mapreduce_time_to_first_token_seconds', result.time_to_first_token, kind=kind)
+        METRICS.inc('mapreduce_tokens_total', result.input_tokens, type="input")
+        METRICS.inc('mapreduce_tokens_total', result.output_tokens, type="output")
+        METRICS.inc('mapreduce_tokens_total', result.cache_read_tokens, type="cache_read")
+        METRICS.inc('mapreduce_tokens_total', result.cache_creation_tokens, type="cache_creation")
+        METRICS.inc('mapreduce_cost_usd_total', result.cost_usd)
+        return result
+
+    def start_metrics(self, port: Optional[int] = None, textfile: Optional[str] = None):
+        """Expose metrics over HTTP and/or a textfile for the rest of this run"""
+        metrics_config = self.config.get('execution', {}).get('metrics', {})
+        port = port if port is not None else metrics_config.get('port')
+        textfile = textfile or metrics_config.get('textfile')
+        self._metrics_textfile = Path(textfile) if textfile else None
+        if port is not None:
+            host = metrics_config.get('host', '127.0.0.1')
+            METRICS.serve(host, port)
+            status(B, f"Metrics on http://{host}:{port}/metrics")
+        self._export_metrics()
+
+    def _export_metrics(self):
+        """Refresh the metrics textfile, if one is configured"""
+        if self._metrics_textfile:
+            METRICS.write_textfile(self._metrics_textfile)
+
+    def enable_tracing(self):
+        """Export spans for this process to traces/trace_<timestamp>_<pid>.jsonl"""
+        if not TRACER.enabled:
+            TRACER.configure(self._trace_dir() / f"trace_{datetime.now():%Y%m%d_%H%M%S}_{os.getpid()}.jsonl")
+
+    def _trace_dir(self) -> Path:
+        """Directory trace files are written to"""
+        tracing_config = self.config.get('execution', {}).get('tracing', {})
+        return Path(tracing_config['dir']) if tracing_config.get('dir') else self.framework_dir / "traces"
+
+    def trace_summary(self, trace_file: Optional[str] = None) -> int:
+        """Summarize where wall time went in a trace (the latest one by default)"""
+        if trace_file:
+            path = Path(trace_file)
+        else:
+            traces = sorted(self._trace_dir().glob("trace_*.jsonl"), key=lambda p: p.stat().st_mtime)
+            if not traces:
+                status(Y, "No traces found. Run a command with --trace first.")
+                return 1
+            path = traces[-1]
+
+        with open(path, 'rb') as f:
+            spans = [json_loads(line) for line in f if line.strip()]
+
+        child_ms: Dict[str, float] = {}
+        for span in spans:
+            if span.get('parentSpanId'):
+                child_ms[span['parentSpanId']] = child_ms.get(span['parentSpanId'], 0.0) + span['durationMs']
+
+        # name -> [count, total ms, self ms, max ms]
+        totals: Dict[str, List[float]] = {}
+        ttfts = []
+        for span in spans:
+            entry = totals.setdefault(span['name'], [0, 0.0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += span['durationMs']
+            # Parallel children can outlast their parent's wall time
+            entry[2] += max(0.0, span['durationMs'] - child_ms.get(span['spanId'], 0.0))
+            entry[3] = max(entry[3], span['durationMs'])
+            if span.get('attributes', {}).get('ttft_ms') is not None:
+                ttfts.append(span['attributes']['ttft_ms'])
+
+        print(f"{B}=== Trace Summary: {path} ==={N}")
+        print(f"{'span':<32} {'count':>7} {'total ms':>12} {'self ms':>12} {'max ms':>10}")
+        for name, (count, total, own, longest) in sorted(totals.items(), key=lambda kv: -kv[1][2]):
+            print(f"{name:<32} {count:>7} {total:>12.1f} {own:>12.1f} {longest:>10.1f}")
+        if ttfts:
+            print(f"Time to first token: {Y}{sum(ttfts) / len(ttfts):.0f}ms{N} mean, {Y}{max(ttfts):.0f}ms{N} max")
+        return 0
+
+    def export_items(self, output: Optional[str] = None, fmt: str = 'auto') -> int:
+        """Write a columnar snapshot of the item store for external analysis"""
+        master_data = self._load_master_data()
+        items = master_data.get('items', {})
+        if not items:
+            status(Y, "No items to export. Run populate first.")
+            return 1
+
+        if fmt == 'auto' and output:
+            suffix = Path(output).suffix
+            fmt = 'parquet' if suffix == '.parquet' else 'binary' if suffix == '.mrcol' else 'auto'
+        if output:
+            path = Path(output)
+            fmt = ColumnarExport.write(items.values(), path, fmt)
+        else:
+            # Pick the format first so the default name gets the right extension
+            tmp_path = self.data_dir / "items.export.tmp"
+            fmt = ColumnarExport.write(items.values(), tmp_path, fmt)
+            path = self.data_dir / f"items.{'parquet' if fmt == 'parquet' else 'mrcol'}"
+            os.replace(tmp_path, path)
+
+        status(G, f"✓ Exported {len(items)} items to {path} ({fmt}, {path.stat().st_size:,} bytes)")
+        return 0
+
+    def _get_log_store(self) -> LogStore:
+        """Create the transcript log store once per run"""
+        if self._log_store is None:
+            self._log_store = LogStore(self.logs_dir, self.config.get('execution', {}).get('logs', {}))
+
+        return self._log_store
+
+    def show_logs(self, item: Optional[str] = None, grep: Optional[str] = None, show_all: bool = False) -> int:
+        """Print stored transcripts for an item, or list runs matching a pattern"""
+        log_store = self._get_log_store()
+        if grep:
+            matches = log_store.search(grep)
+            for entry in matches:
+                print(f"{entry['time']}  {entry['label']:<12} {entry['key']}  ({entry['file']})")
+            status(G if matches else Y, f"{len(matches)} matching runs")
+            return 0
+
+        if not item:
+            status(R, "Give an item path or --grep PATTERN")
+            return 1
+
+        entries = log_store.entries(item)
+        if not entries:
+            status(Y, f"No logs stored for {item}")
+            return 1
+
+        for entry in entries if show_all else entries[-1:]:
+            status(B, f"=== {entry['key']} [{entry['label']}] {entry['time']} ===")
+            sys.stdout.write(log_store.read(entry))
+        return 0
+
+    def compact_context(self) -> int:
+        """Compact the global context scratchsheet in place"""
+        context_manager = self._get_context_manager()
+        if not context_manager or not context_manager.context_path.exists():
+            status(Y, "No global context to compact.")
+            return 0
+
+        if context_manager.update_mode == 'append_log':
+            merged = context_manager.merge_updates(force=True)
+            if merged:
+                status(G, f"✓ Merged {merged} context updates (snapshot v{context_manager.snapshot_version()})")
+
+        with open(context_manager.context_path, 'r') as f:
+            before = estimate_tokens(f.read())
+        after = estimate_tokens(context_manager.compact())
+
+        status(G, f"✓ Compacted global context: ~{before:,} -> ~{after:,} tokens")
+        return 0
+
     def _initialize_global_context(self, context_path: Path):
         """Initialize the scratchsheet with configurable structure"""
         project_name = self.config['project']['name']
@@ -634,6 +4573,41 @@ class GenericMapReduce:
         with open(context_path, 'w') as f:
             f.write(initial_content)
 
+    def _get_prompt_plan(self) -> PromptPlan:
+        """Build the item-invariant prompt fragments once per run"""
+        if self._prompt_plan is None:
+            map_config = self.config['map']
+            global_context_config = map_config.get('global_context', {})
+            context_file = global_context_config.get('context_file', '')
+
+            static_vars = {
+                'context_file': context_file,
+                'assessment_instructions': self._build_assessment_instructions(),
+                'output_requirements': self._build_output_requirements()
+            }
+            rules = {'context_update_rules': global_context_config.get('context_update_rules', '')}
+            batch_update_instructions = None
+            if map_config.get('output_mode', 'agent_file') == 'inline':
+                update_instructions = TemplateEngine.render_template(INLINE_RESPONSE_FORMAT, rules)
+                batch_update_instructions = TemplateEngine.render_template(INLINE_BATCH_UPDATE_INSTRUCTIONS, rules)
+            elif global_context_config.get('update_mode', 'in_place') == 'append_log':
+                update_instructions = TemplateEngine.render_template(APPEND_LOG_UPDATE_INSTRUCTIONS, rules)
+            else:
+                update_instructions = TemplateEngine.render_template(IN_PLACE_UPDATE_INSTRUCTIONS, rules)
+
+            self._prompt_plan = PromptPlan.build(
+                map_config['processing_template'],
+                static_vars,
+                update_instructions,
+                context_file,
+                layout=map_config.get('prompt_layout', 'template'),
+                batch_update_instructions=batch_update_instructions
+            )
+            plan = self._prompt_plan
+            self.processing_engine.set_cache_prefixes((plan.static_prefix, plan.batch_prefix, plan.chunk_prefix))
+
+        return self._prompt_plan
+
     def _build_assessment_instructions(self) -> str:
         """Build assessment instructions from configuration"""
         map_config = self.config['map']
@@ -670,30 +4644,39 @@ Please ensure your output follows this structure exactly.
 """
         return requirements
 
-    def status(self) -> int:
-        """Show processing status"""
+    def status(self, watch: Optional[float] = None) -> int:
+        """Show processing status, refreshing every `watch` seconds if given"""
         if not self.framework_dir.exists():
             status(R, "Framework not initialized. Run populate first.")
             return 1
 
-        master_data = self._load_master_data()
-        if not master_data:
+        if watch is None:
+            return self._print_status()
+
+        try:
+            while True:
+                # Clear the screen and redraw in place
+                sys.stdout.write("\033[H\033[2J")
+                print(f"{datetime.now():%H:%M:%S}  (every {watch:g}s, Ctrl-C to stop)")
+                self._print_status()
+                sys.stdout.flush()
+                time.sleep(watch)
+        except KeyboardInterrupt:
+            return 0
+
+    def _print_status(self) -> int:
+        """Print counts, usage and ETA from the status summary"""
+        summary = self._load_store_summary()
+        if not summary:
             status(R, "No master data found. Run populate first.")
             return 1
 
-        items = master_data.get('items', {})
-        total = len(items)
-
+        total = summary.data['total']
         if total == 0:
             status(Y, "No items to process.")
             return 0
 
-        # Count by status
-        status_counts = {}
-        for item in items.values():
-            item_status = item.get('status', 'unknown')
-            status_counts[item_status] = status_counts.get(item_status, 0) + 1
-
+        status_counts = summary.data['counts']
         status(B, "=== Processing Status ===")
         print(f"Total items: {Y}{total}{N}")
 
@@ -701,14 +4684,33 @@ Please ensure your output follows this structure exactly.
             color = G if item_status == 'completed' else Y if item_status == 'in_progress' else R
             print(f"{item_status:15} {color}{count:4d}{N} ({count/total*100:5.1f}%)")
 
-        if total > 0:
-            completed = status_counts.get('completed', 0)
-            pct = completed / total
-            bar = "█" * int(20 * pct) + "░" * int(20 * (1 - pct))
-            print(f"Progress: [{G}{bar}{N}] {pct*100:.1f}%")
+        completed = status_counts.get('completed', 0)
+        pct = completed / total
+        bar = "█" * int(20 * pct) + "░" * int(20 * (1 - pct))
+        print(f"Progress: [{G}{bar}{N}] {pct*100:.1f}%")
+
+        rate = summary.throughput()
+        eta = summary.eta_seconds()
+        if rate and summary.pending:
+            hours, rest = divmod(int(eta), 3600)
+            print(f"Throughput: {Y}{rate * 3600:.1f}{N} items/h (last {len(summary.data['recent_completions'])}), "
+                  f"ETA {Y}{hours}h {rest // 60:02d}m{N}")
+
+        # Token usage and prompt cache effectiveness across processed items
+        usage = summary.data['usage']
+        input_tokens = usage['input_tokens']
+        cache_read = usage['cache_read_tokens']
+        cache_creation = usage['cache_creation_tokens']
+        if input_tokens > 0:
+            hit_ratio = cache_read / (input_tokens + cache_creation)
+            print(f"Tokens: {Y}{input_tokens:,}{N} in + {Y}{usage['output_tokens']:,}{N} out, "
+                  f"cost {Y}${usage['cost_usd']:.4f}{N}")
+            print(f"Cache: {Y}{cache_read:,}{N} read, {Y}{cache_creation:,}{N} created, "
+                  f"hit ratio {Y}{hit_ratio*100:.1f}%{N}")
 
         return 0
 
+    @TRACER.traced("reduce_synthesize")
     def reduce_synthesize(self, severity: str = "medium", category: str = "all") -> int:
         """Stage 3: Reduce - synthesize results into actionable insights"""
         if not self.framework_dir.exists():
@@ -716,7 +4718,7 @@ Please ensure your output follows this structure exactly.
             return 1
 
         # Check processing engine availability
-        if not self.processing_engine.check_availability():
+        if not self._engine_available():
             status(R, "Error: Processing engine not available!")
             return 1
 
@@ -735,7 +4737,7 @@ Please ensure your output follows this structure exactly.
         status(B, f"=== Stage 3: Reduce - Synthesizing {len(filtered_results)} results ===")
 
         # Create synthesis directory
-        synthesis_dir = self.framework_dir / "synthesis"
+        synthesis_dir = self.synthesis_dir
         synthesis_dir.mkdir(exist_ok=True)
 
         # Prepare synthesis data
@@ -747,10 +4749,10 @@ Please ensure your output follows this structure exactly.
         prompt = TemplateEngine.render_template(synthesis_template, synthesis_data)
 
         # Run synthesis
-        self.logs_dir.mkdir(exist_ok=True)
-        log_file = self.logs_dir / f"reduce_{datetime.now():%Y%m%d_%H%M%S}.log"
-
-        result = self.processing_engine.synthesize_results(prompt, log_file)
+        log_store = self._get_log_store()
+        log_key = f"reduce/{severity}_{category}"
+        with log_store.capture([log_key], label="reduce") as log_file:
+            result = self._run_engine(prompt, log_file, synthesis=True)
 
         if result.success:
             # Save synthesis result
@@ -773,51 +4775,72 @@ Please ensure your output follows this structure exactly.
             return 0
         else:
             status(R, f"✗ Synthesis failed! {result.error_message or 'Unknown error'}")
-            status(R, f"Check log: {log_file}")
+            status(R, f"Check log: {log_store.path_for(log_key)}")
             return 1
 
+    @TRACER.traced("reduce.collect_results")
     def _collect_results(self) -> List[Dict[str, Any]]:
         """Collect all processing results"""
         results = []
+        cache = {}
 
-        # Traverse results directory
-        for result_file in self.results_dir.rglob('*'):
-            if result_file.is_file():
+        # Traverse results directory; files unchanged since the last collection are not re-parsed
+        for result_file in self.results_dir.rglob('*.xml'):
+            try:
+                stat = result_file.stat()
+            except OSError:
+                continue
+            if not result_file.is_file():
+                continue
+            key = str(result_file)
+            signature = (stat.st_mtime_ns, stat.st_size)
+            cached = self._result_cache.get(key)
+            if cached and cached[0] == signature:
+                xml_data = cached[1]
+            else:
                 try:
-                    if result_file.suffix == '.xml':
-                        # Parse XML results (only XML files supported)
-                        import xml.etree.ElementTree as ET
-                        tree = ET.parse(result_file)
-                        root = tree.getroot()
-
-                        # Extract key data from XML
-                        xml_data = {
-                            'metadata': {
-                                'source_file': result_file.stem,
-                                'format': 'xml'
-                            },
-                            'scores': {},
-                            'findings': []
-                        }
-
-                        # Extract scores
-                        for score_elem in root.findall('.//scores/*'):
-                            if score_elem.text:
-                                xml_data['scores'][score_elem.tag] = int(score_elem.text)
-
-                        # Extract issues/findings
-                        for issue_elem in root.findall('.//issues/issue'):
-                            issue = {}
-                            for child in issue_elem:
-                                issue[child.tag] = child.text
-                            xml_data['findings'].append(issue)
-
-                        results.append(xml_data)
+                    xml_data = self._parse_result_file(result_file)
                 except Exception as e:
                     status(Y, f"Warning: Could not parse {result_file}: {e}")
+                    continue
+            cache[key] = (signature, xml_data)
+            results.append(xml_data)
 
+        self._result_cache = cache
         return results
 
+    @staticmethod
+    def _parse_result_file(result_file: Path) -> Dict[str, Any]:
+        """Scores and findings from one XML result (only XML files supported)"""
+        import xml.etree.ElementTree as ET
+        tree = ET.parse(result_file)
+        root = tree.getroot()
+
+        # Extract key data from XML
+        xml_data = {
+            'metadata': {
+                'source_file': result_file.stem,
+                'format': 'xml'
+            },
+            'scores': {},
+            'findings': []
+        }
+
+        # Extract scores
+        for score_elem in root.findall('.//scores/*'):
+            if score_elem.text:
+                xml_data['scores'][score_elem.tag] = int(score_elem.text)
+
+        # Extract issues/findings
+        for issue_elem in root.findall('.//issues/issue'):
+            issue = {}
+            for child in issue_elem:
+                issue[child.tag] = child.text
+            xml_data['findings'].append(issue)
+
+        return xml_data
+
+    @TRACER.traced("reduce.filter_results")
     def _filter_results(self, results: List[Dict[str, Any]], severity: str, category: str) -> List[Dict[str, Any]]:
         """Filter results based on severity and category"""
         filtered = []
@@ -844,6 +4867,7 @@ Please ensure your output follows this structure exactly.
 
         return filtered
 
+    @TRACER.traced("reduce.prepare")
     def _prepare_synthesis_data(self, results: List[Dict[str, Any]], severity: str, category: str) -> Dict[str, Any]:
         """Prepare data for synthesis template"""
 
@@ -888,20 +4912,67 @@ def main():
         "config",
         help="Path to configuration file"
     )
+    parser.add_argument("--trace", action="store_true", help="Export timing spans to <framework>/traces/")
 
     sub = parser.add_subparsers(dest="command", help="Commands")
 
     # Populate command
     populate_parser = sub.add_parser("populate", help="Collect items for processing")
     populate_parser.add_argument("directories", nargs="*", help="Specific directories to process (optional)")
+    populate_parser.add_argument("--ref",
+                                 help="Collect files from this commit instead of the working tree (git strategy)")
 
     # Status command
-    sub.add_parser("status", help="Show processing status")
+    status_parser = sub.add_parser("status", help="Show processing status")
+    status_parser.add_argument("--watch", type=float, nargs="?", const=2.0, metavar="SECONDS",
+                               help="Redraw every SECONDS (default 2) until interrupted")
 
     # Process command
     sub.add_parser("map-next", help="Process next item")
     process_all_parser = sub.add_parser("map-all", help="Process all items")
     process_all_parser.add_argument("--delay", type=int, default=5, help="Delay between items (seconds)")
+    process_all_parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on this port")
+    process_all_parser.add_argument("--metrics-textfile", help="Keep a textfile-collector metrics file updated")
+
+    serve_parser = sub.add_parser("serve", help="Stay resident and map items as they are populated")
+    serve_parser.add_argument("--poll", type=float, metavar="SECONDS", help="Idle poll interval (default 5)")
+    serve_parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on this port")
+    serve_parser.add_argument("--metrics-textfile", help="Keep a textfile-collector metrics file updated")
+
+    watch_parser = sub.add_parser("watch", help="Map files as they change and re-run reduce on a schedule")
+    watch_parser.add_argument("directories", nargs="*", help="Directories to watch (default: current directory)")
+    watch_parser.add_argument("--debounce", type=float, metavar="SECONDS",
+                              help="Quiet time before a burst is applied (default 1)")
+    watch_parser.add_argument("--reduce-every", type=float, metavar="SECONDS",
+                              help="Re-run reduce this often while results change")
+    watch_parser.add_argument("--severity", choices=["high", "medium", "low"], default="medium",
+                              help="Severity for scheduled reduces")
+    watch_parser.add_argument("--category", default="all", help="Category for scheduled reduces")
+    watch_parser.add_argument("--poll", type=float, metavar="SECONDS",
+                              help="Idle wait, and scan interval without inotify (default 2)")
+    watch_parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on this port")
+    watch_parser.add_argument("--metrics-textfile", help="Keep a textfile-collector metrics file updated")
+
+    sub.add_parser("preflight", help="Check the processing engine's version, auth and capabilities")
+
+    # Global context maintenance
+    sub.add_parser("compact-context", help="Compact the global context scratchsheet")
+
+    # Transcript logs
+    logs_parser = sub.add_parser("logs", help="Show stored transcripts for an item")
+    logs_parser.add_argument("item", nargs="?", help="Item path (or reduce/<severity>_<category>)")
+    logs_parser.add_argument("--all", action="store_true", help="Show every stored run, not just the latest")
+    logs_parser.add_argument("--grep", help="List runs whose transcript matches this regular expression")
+
+    # Tracing
+    trace_parser = sub.add_parser("trace-summary", help="Summarize where time went in a trace")
+    trace_parser.add_argument("trace_file", nargs="?", help="Trace file (default: latest in traces/)")
+
+    # Columnar export
+    export_parser = sub.add_parser("export", help="Export the item store in columnar form")
+    export_parser.add_argument("--output", help="Output file (default: data/items.parquet or data/items.mrcol)")
+    export_parser.add_argument("--format", choices=["auto", "parquet", "binary"], default="auto",
+                               help="Parquet needs pyarrow; binary is the built-in compact format")
 
     # Reduce command
     reduce_parser = sub.add_parser("reduce", help="Synthesize results")
@@ -917,19 +4988,42 @@ def main():
     try:
         framework = GenericMapReduce(Path(args.config))
 
-        if args.command == "populate":
-            return framework.populate(args.directories)
-        elif args.command == "status":
-            return framework.status()
-        elif args.command == "map-next":
-            return framework.map_process()
-        elif args.command == "map-all":
-            return framework.map_process_all(args.delay)
-        elif args.command == "reduce":
-            return framework.reduce_synthesize(args.severity, args.category)
-        else:
-            parser.print_help()
-            return 1
+        if args.command == "trace-summary":
+            # Reading traces must not produce a newer one
+            TRACER.path = None
+            return framework.trace_summary(args.trace_file)
+
+        if args.trace:
+            framework.enable_tracing()
+        TRACER.record("startup", PROCESS_START_NS, time.time_ns())
+
+        with TRACER.span(f"command.{args.command}"):
+            if args.command == "populate":
+                return framework.populate(args.directories, ref=args.ref)
+            elif args.command == "status":
+                return framework.status(args.watch)
+            elif args.command == "map-next":
+                return framework.map_process()
+            elif args.command == "map-all":
+                return framework.map_process_all(args.delay, args.metrics_port, args.metrics_textfile)
+            elif args.command == "preflight":
+                return framework.preflight()
+            elif args.command == "watch":
+                return framework.watch(args.directories, args.debounce, args.reduce_every, args.severity,
+                                       args.category, args.poll, args.metrics_port, args.metrics_textfile)
+            elif args.command == "serve":
+                return framework.serve(args.poll, args.metrics_port, args.metrics_textfile)
+            elif args.command == "compact-context":
+                return framework.compact_context()
+            elif args.command == "logs":
+                return framework.show_logs(args.item, args.grep, args.all)
+            elif args.command == "export":
+                return framework.export_items(args.output, args.format)
+            elif args.command == "reduce":
+                return framework.reduce_synthesize(args.severity, args.category)
+            else:
+                parser.print_help()
+                return 1
 
     except Exception as e:
         status(R, f"Error: {str(e)}")
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Local Stand-in Messages Server for the Generic Map-Reduce Framework
+Serves streaming /v1/messages and /v1/chat/completions responses for testing the http engine
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockResponder:
+    """Builds deterministic responses from the prompt"""
+
+    @staticmethod
+    def respond(prompt: str) -> str:
+        """Return one <analysis> document per item named in the prompt, or a short report"""
+        # Only item header lines; instructions may mention ITEM_PATH with a "(see ...)" reference
+        paths = re.findall(r'^(?:### |- )?(?:ITEM_PATH|FILE_PATH):[ \t]*([^\s(]\S*)', prompt, flags=re.M)
+        if not paths:
+            return "## Executive Summary\n\nStand-in synthesis report generated by the local mock server."
+
+        documents = []
+        for path in dict.fromkeys(paths):
+            documents.append(f"""<analysis>
+  <metadata>
+    <source_file>{path}</source_file>
+    <processor>mock-messages-server</processor>
+  </metadata>
+  <scores>
+    <quality>4</quality>
+  </scores>
+  <issues>
+    <issue>
+      <severity>low</severity>
+      <category>quality</category>
+      <description>Stand-in finding for {path}</description>
+      <recommendation>No action needed</recommendation>
+    </issue>
+  </issues>
+  <summary>Stand-in review of {path}</summary>
+</analysis>""")
+        return "\n".join(documents)
+
+
+class MockMessagesHandler(BaseHTTPRequestHandler):
+    """Streams server-sent events in the Anthropic or OpenAI format"""
+
+    # Keep-alive so the engine's connection pool is exercised; small SSE chunks must not wait on Nagle
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency = 0.0
+    # Blocks marked with cache_control, so repeats are reported as cache reads like the real API
+    cached_blocks = set()
+
+    def log_message(self, format, *args):
+        """Silence per-request logging"""
+        pass
+
+    def do_HEAD(self):
+        """Availability probe"""
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        """Handle a streaming messages or chat completions request"""
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        prompt = "".join(
+            m["content"] if isinstance(m.get("content"), str) else "".join(b.get("text", "") for b in m["content"])
+            for m in body.get("messages", [])
+        )
+        text = MockResponder.respond(prompt)
+        input_tokens, output_tokens = len(prompt) // 4, len(text) // 4
+        cache_read = cache_creation = 0
+        for message in body.get("messages", []):
+            for block in message["content"] if isinstance(message.get("content"), list) else []:
+                if block.get("cache_control"):
+                    tokens = len(block.get("text", "")) // 4
+                    if block.get("text") in self.cached_blocks:
+                        cache_read += tokens
+                    else:
+                        self.cached_blocks.add(block.get("text"))
+                        cache_creation += tokens
+        input_tokens -= cache_read + cache_creation
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if self.path.endswith("/v1/messages"):
+            events = self._anthropic_events(text, input_tokens, output_tokens, cache_read, cache_creation)
+        elif self.path.endswith("/v1/chat/completions"):
+            events = self._openai_events(text, input_tokens, output_tokens)
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for event in events:
+            self._write_chunk(event.encode("utf-8"))
+        self._write_chunk(b"")
+
+    def _write_chunk(self, data: bytes):
+        """Write one HTTP/1.1 chunk"""
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    @staticmethod
+    def _split(text: str, size: int = 200):
+        """Split text into streaming deltas"""
+        return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+    def _anthropic_events(self, text: str, input_tokens: int, output_tokens: int, cache_read: int = 0,
+                          cache_creation: int = 0):
+        """Messages API event sequence"""
+        def sse(event_type, data):
+            return f"event: {event_type}\ndata: {json.dumps(dict(data, type=event_type))}\n\n"
+
+        events = [sse("message_start", {"message": {"usage": {
+            "input_tokens": input_tokens, "output_tokens": 1,
+            "cache_read_input_tokens": cache_read, "cache_creation_input_tokens": cache_creation}}}),
+            sse("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}})]
+        for part in self._split(text):
+            events.append(sse("content_block_delta", {"index": 0, "delta": {"type": "text_delta", "text": part}}))
+        events += [sse("content_block_stop", {"index": 0}),
+                   sse("message_delta", {"delta": {"stop_reason": "end_turn"},
+                                         "usage": {"output_tokens": output_tokens}}),
+                   sse("message_stop", {})]
+        return events
+
+    def _openai_events(self, text: str, input_tokens: int, output_tokens: int):
+        """Chat completions event sequence"""
+        events = [f"data: {json.dumps({'choices': [{'index': 0, 'delta': {'content': part}}]})}\n\n"
+                  for part in self._split(text)]
+        usage = {'prompt_tokens': input_tokens, 'completion_tokens': output_tokens}
+        events.append(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n")
+        events.append("data: [DONE]\n\n")
+        return events
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description="Local stand-in messages server for testing the http processing engine"
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each response")
+
+    args = parser.parse_args()
+
+    MockMessagesHandler.latency = args.latency
+    server = ThreadingHTTPServer((args.host, args.port), MockMessagesHandler)
+    print(f"Mock messages server listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())